@@ -0,0 +1,130 @@
+"""웹툰 생성기용 산출물 저장소(키-값) 서버 - 로컬 대체 서버
+
+여러 복제본이 폰트, 프레임, 분석 결과 캐시, 생성 기록 이미지를 공유할 수 있도록 HttpKVStore가 사용하는 프로토콜을 구현합니다.
+실제 배포에서는 같은 프로토콜을 따르는 네트워크 저장소로 바꿔 쓸 수 있습니다.
+
+    GET    /kv/<key>          내용 (없으면 404)
+    PUT    /kv/<key>          내용 저장 (임시 파일에 쓴 뒤 교체)
+    DELETE /kv/<key>          삭제 (없으면 404)
+    GET    /kv/?prefix=<dir>  prefix 바로 아래 항목 목록 [{"key", "size", "mtime"}]
+
+사용법:
+    python artifact_store_server.py --port 8700 --root artifact_store
+    WEBTOON_ARTIFACT_STORE=http://127.0.0.1:8700 streamlit run webtoon_final_v4.py
+"""
+import argparse
+import json
+import os
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class ArtifactStoreHandler(BaseHTTPRequestHandler):
+    root = "artifact_store"
+
+    def resolve(self, key):
+        # 저장소 루트 밖을 가리키는 키(../ 등)는 거부
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, key))
+        if not key or os.path.commonpath([root, path]) != root or path == root:
+            return None
+        return path
+
+    def parse(self):
+        parts = urlsplit(self.path)
+        if not parts.path.startswith("/kv/"):
+            return None, None
+        return unquote(parts.path[len("/kv/"):]), parse_qs(parts.query)
+
+    def send_body(self, status, body=b"", content_type="application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        key, query = self.parse()
+        if key is None:
+            return self.send_body(404)
+        if key == "":
+            return self.list_entries(query.get("prefix", [""])[0].strip("/"))
+        path = self.resolve(key)
+        if path is None:
+            return self.send_body(400)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return self.send_body(404)
+        self.send_body(200, body)
+
+    def list_entries(self, prefix):
+        directory = self.resolve(prefix) if prefix else os.path.realpath(self.root)
+        if directory is None:
+            return self.send_body(400)
+        entries = []
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    key = f"{prefix}/{entry.name}" if prefix else entry.name
+                    entries.append({"key": key, "size": stat.st_size, "mtime": stat.st_mtime})
+        self.send_body(200, json.dumps(entries).encode("utf-8"), "application/json")
+
+    def do_PUT(self):
+        key, _ = self.parse()
+        path = self.resolve(key) if key else None
+        if path is None:
+            return self.send_body(400)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return self.send_body(500)
+        self.send_body(204)
+
+    def do_DELETE(self):
+        key, _ = self.parse()
+        path = self.resolve(key) if key else None
+        if path is None:
+            return self.send_body(400)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return self.send_body(404)
+        # 비어 있는 상위 디렉토리(예: history/<작업 ID>/)도 정리
+        if os.path.dirname(path) != os.path.realpath(self.root):
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        self.send_body(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="웹툰 생성기 산출물 저장소 (로컬 대체 서버)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--root", default="artifact_store")
+    args = parser.parse_args()
+
+    ArtifactStoreHandler.root = args.root
+    os.makedirs(args.root, exist_ok=True)
+    server = ThreadingHTTPServer((args.host, args.port), ArtifactStoreHandler)
+    print(f"산출물 저장소: http://{args.host}:{args.port} (root={os.path.abspath(args.root)})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
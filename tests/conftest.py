@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+from streamlit.delta_generator_singletons import get_dg_singleton_instance
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# 앱 스크립트는 임포트할 때 Streamlit bare 모드로 한 번 실행되며 images/, fonts/ 등을 현재 디렉토리 기준으로 찾음
+@pytest.fixture(scope="session")
+def app():
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import webtoon_final_v4
+        # bare 모드의 st.form은 공용 main_dg에 폼 정보를 남기므로, 같은 프로세스의 AppTest 실행에 새지 않도록 되돌림
+        get_dg_singleton_instance().main_dg._form_data = None
+        yield webtoon_final_v4
+    finally:
+        os.chdir(cwd)
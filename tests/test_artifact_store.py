@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+import requests
+
+UNREACHABLE_STORE = "http://127.0.0.1:9"  # discard 포트: 연결이 바로 거부됨
+
+
+def test_local_store_round_trip(app, tmp_path):
+    store = app.FrontCachedStore(app.LocalDirStore(str(tmp_path)), max_bytes=10)
+    store.put("t/a", b"12345")
+    store.put("t/b", b"123456")
+    assert store.get("t/a") == b"12345"
+    assert sorted(key for key, _, _ in store.list("t")) == ["t/a", "t/b"]
+    assert not [name for name in os.listdir(tmp_path / "t") if name.endswith(".tmp")]
+    store.delete("t/a")
+    assert store.get("t/a") is None
+
+
+def test_unreachable_store_fails_fast_after_first_error(app):
+    store = app.HttpKVStore(UNREACHABLE_STORE)
+    with pytest.raises(requests.ConnectionError):
+        store.get("images/A_Frame.png")
+    start = time.perf_counter()
+    with pytest.raises(requests.ConnectionError):
+        store.get("images/A_Frame.png")
+    assert time.perf_counter() - start < 0.1
+
+
+def test_frames_fall_back_to_bundled_files(app, monkeypatch):
+    monkeypatch.setattr(app, "artifact_store", app.FrontCachedStore(app.HttpKVStore(UNREACHABLE_STORE)))
+    with open(os.path.join(app.BUNDLED_ASSET_DIR, "images", "B_Frame.png"), "rb") as f:
+        assert app.get_frame_image_bytes("B") == f.read()
+
+
+def test_history_images_readable_from_another_replica(app, monkeypatch, tmp_path):
+    shared_root = str(tmp_path / "store")
+    monkeypatch.setattr(app, "HISTORY_DB", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(app, "artifact_store", app.FrontCachedStore(app.LocalDirStore(shared_root)))
+    panels = [app.ProceduralBackend().render(f"패널 {i}", "256x256") for i in range(2)]
+    expected = [panel.tobytes() for panel in panels]
+    job_id = app.save_history_job("스토리", "스타일", "A", "기본 방울형", "설명", [{}, {}], ["p1", "p2"],
+                                  panels, app.create_layout_image(panels, "A"), {})
+
+    # 다른 복제본: 앞단 캐시는 비어 있고 같은 저장소만 공유
+    monkeypatch.setattr(app, "artifact_store", app.FrontCachedStore(app.LocalDirStore(shared_root)))
+    loaded = app.load_history_panels(job_id, 2)
+    assert [panel.tobytes() for panel in loaded] == expected
+    assert app.read_history_artifact(job_id, "composite.png")
+
+    app.delete_history_job(job_id)
+    assert app.load_history_panels(job_id, 2) is None
+    assert not os.path.exists(os.path.join(shared_root, "history", job_id))
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+
+# 요청을 받으면 release가 설정될 때까지 응답하지 않는 채팅 API 서버
+@pytest.fixture
+def slow_server():
+    received = threading.Event()
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            received.set()
+            release.wait(10)
+            body = json.dumps({"id": "x", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+                               "choices": [{"index": 0, "finish_reason": "stop",
+                                            "message": {"role": "assistant", "content": "늦은 응답"}}]}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1", received
+    release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_cancel_aborts_in_flight_call(app, slow_server, monkeypatch):
+    base_url, received = slow_server
+    token = app.CancelToken("test_job", planned_calls=2)
+    token.http_client = openai.DefaultHttpxClient()
+    token.client = openai.OpenAI(api_key="test", base_url=base_url, http_client=token.http_client)
+    monkeypatch.setattr(app, "job_token", token)
+    outcome = {}
+
+    def call():
+        try:
+            outcome["result"] = app.call_api(app.api_client().chat.completions.create, model="gpt-4o-mini",
+                                             messages=[{"role": "user", "content": "안녕"}])
+        except BaseException as e:  # noqa: BLE001
+            outcome["error"] = e
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    assert received.wait(5)
+    time.sleep(0.3)  # 요청을 보낸 뒤 응답을 기다리는 중에 취소
+    cancelled_at = time.perf_counter()
+    token.cancel()
+    thread.join(5)
+    assert not thread.is_alive()
+    # 서버는 10초 동안 응답하지 않으므로 연결을 끊어야만 바로 끝남
+    assert time.perf_counter() - cancelled_at < 3
+    assert isinstance(outcome.get("error"), app.JobCancelled)
+    summary = token.summary()
+    assert summary["aborted_calls"] == 1
+    assert summary["skipped_calls"] == 1
+
+
+def test_retried_panels_are_planned_calls(app, monkeypatch):
+    token = app.CancelToken("test_job", planned_calls=3)
+    monkeypatch.setattr(app, "job_token", token)
+
+    class FlakyBackend:
+        name = "flaky"
+        max_batch = 4
+        calls_api = True
+        prompt_model = app.IMAGE_MODEL
+
+        def generate_many(self, prompts, size="1024x1024", quality="standard", on_result=None):
+            return [None] * len(prompts)
+
+    monkeypatch.setattr(app.st, "warning", lambda *args, **kwargs: None)
+    descriptor = app.CharacterDescriptor(["주인공"], ["짧은 검은 머리"])
+    app.generate_panel_images(["장면 1", "장면 2", "장면 3"], "웹툰 스타일", "웹툰", descriptor, FlakyBackend())
+    assert token.planned_calls == 6
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+import threading
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **params):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"응답 {self.calls}"))])
+
+
+def use_store(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "artifact_store", app.FrontCachedStore(app.LocalDirStore(str(tmp_path))))
+    monkeypatch.setattr(app, "chat_cache_writes", {"count": 0, "lock": threading.Lock()})
+    monkeypatch.setattr(app, "client", FakeClient())
+    monkeypatch.setattr(app, "job_token", None)
+    monkeypatch.setattr(app, "chat_seed", None)
+
+
+def test_responses_are_not_written_when_reuse_is_off(app, monkeypatch, tmp_path):
+    use_store(app, monkeypatch, tmp_path)
+    monkeypatch.setattr(app, "reuse_chat_cache", False)
+    assert app.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "안녕"}]) == "응답 1"
+    assert app.artifact_store.list(app.CHAT_CACHE_PREFIX) == []
+
+    monkeypatch.setattr(app, "reuse_chat_cache", True)
+    assert app.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "안녕"}]) == "응답 2"
+    assert app.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "안녕"}]) == "응답 2"
+    assert len(app.artifact_store.list(app.CHAT_CACHE_PREFIX)) == 1
+
+
+def test_cache_is_pruned_every_few_writes(app, monkeypatch, tmp_path):
+    use_store(app, monkeypatch, tmp_path)
+    monkeypatch.setattr(app, "CHAT_CACHE_MAX_ENTRIES", 3)
+    prunes = []
+    prune_artifacts = app.prune_artifacts
+    monkeypatch.setattr(app, "prune_artifacts", lambda *args: prunes.append(args) or prune_artifacts(*args))
+    for k in range(app.CHAT_CACHE_PRUNE_EVERY * 2 + 1):
+        app.write_chat_cache(f"key{k}", "gpt-4o-mini", f"응답 {k}")
+    assert len(prunes) == 2
+    assert len(app.artifact_store.list(app.CHAT_CACHE_PREFIX)) == 4
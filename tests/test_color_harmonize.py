@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def make_panels(app, count, size="1024x1024"):
+    backend = app.ProceduralBackend()
+    return [backend.render(f"색감 패널 {i}", size) for i in range(count)]
+
+
+def test_reference_statistics_match_sampled_pixels(app):
+    img = make_panels(app, 1, "256x256")[0]
+    reference = app.compute_color_reference(img, "통계")
+    sample = np.asarray(img.resize((64, 64), Image.NEAREST).convert("YCbCr")).reshape(-1, 3)
+    assert np.allclose(reference["mean"], sample.mean(axis=0))
+    assert np.allclose(reference["std"], sample.std(axis=0), atol=1e-4)
+    cdf = app.compute_color_reference(img, "히스토그램")["cdf"]
+    assert cdf.shape == (3, 256) and np.allclose(cdf[:, -1], 1.0)
+
+
+def test_lut_is_identity_for_matching_statistics(app):
+    img = make_panels(app, 1, "256x256")[0]
+    reference = app.compute_color_reference(img, "통계")
+    assert app.build_color_lut(reference, reference, 1.0) == list(range(256)) * 3
+    for method in ("통계", "히스토그램"):
+        reference = app.compute_color_reference(img, method)
+        assert app.build_color_lut(reference, app.compute_color_reference(img.point(lambda v: v // 2), method), 0.0) \
+            == list(range(256)) * 3
+
+
+def test_harmonized_panel_moves_toward_reference(app):
+    reference_img, panel = make_panels(app, 2, "256x256")
+    dark = panel.point(lambda v: v // 2)
+    for method in ("통계", "히스토그램"):
+        reference = app.compute_color_reference(reference_img, method)
+        result = app.harmonize_panel(dark, reference, 1.0)
+        luma = lambda img: np.asarray(img.convert("L"), dtype=np.float64).mean()
+        assert abs(luma(result) - luma(reference_img)) < abs(luma(dark) - luma(reference_img)) / 2
+
+    # 통계 방식의 RGB 행렬 변환은 YCbCr LUT 변환과 거의 같은 결과
+    reference = app.compute_color_reference(reference_img, "통계")
+    lut = app.build_color_lut(reference, app.compute_color_reference(dark, "통계"), 0.7)
+    via_lut = np.asarray(dark.convert("YCbCr").point(lut).convert("RGB"), dtype=int)
+    via_matrix = np.asarray(app.harmonize_panel(dark, reference, 0.7), dtype=int)
+    assert np.abs(via_lut - via_matrix).max() <= 4
+
+
+def test_reference_is_first_panel_regardless_of_completion_order(app):
+    panels = make_panels(app, 4, "256x256")
+
+    def run(order, failed=()):
+        state = app.new_color_state()
+        results = {}
+        for i in order:
+            for k, img in app.harmonize_in_order(state, i, None if i in failed else panels[i], "통계", 0.7):
+                assert k not in results
+                results[k] = img
+        return results
+
+    in_order = run([0, 1, 2, 3])
+    assert np.array_equal(np.asarray(in_order[0]), np.asarray(panels[0]))  # 기준 패널은 그대로
+    assert run([3, 1, 2]) == {}  # 기준 패널이 오기 전에는 보류
+    for order in ([3, 1, 2, 0], [2, 0, 3, 1]):
+        shuffled = run(order)
+        assert sorted(shuffled) == [0, 1, 2, 3]
+        for k in range(4):
+            assert np.array_equal(np.asarray(shuffled[k]), np.asarray(in_order[k]))
+
+    # 1번 패널이 실패하면 다음 번호의 완성된 패널이 기준
+    without_first = run([2, 0, 1, 3], failed={0})
+    assert without_first[0] is None
+    assert np.array_equal(np.asarray(without_first[1]), np.asarray(panels[1]))
+
+
+def test_benchmark_four_full_size_panels(app):
+    # 1024x1024 패널 4장 (기준 1장 + 맞출 3장) 전체가 100 ms보다 충분히 빨라야 함
+    panels = make_panels(app, 4)
+    for img in panels:
+        img.load()
+    for method in ("통계", "히스토그램"):
+        best = float("inf")
+        for _ in range(5):
+            state = app.new_color_state()
+            start = time.perf_counter()
+            for i, img in enumerate(panels):
+                app.harmonize_in_order(state, i, img, method, 0.7)
+            best = min(best, time.perf_counter() - start)
+        print(f"{method}: {best * 1000:.1f} ms")
+        assert best < 0.1
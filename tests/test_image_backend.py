@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+
+def test_procedural_backend_is_deterministic_and_keeps_prompt_order(app):
+    backend = app.ProceduralBackend()
+    prompts = ["비 오는 거리의 주인공", "햇살 가득한 교실", "밤하늘 아래 옥상"]
+    first = backend.generate_many(prompts, size="256x256")
+    second = backend.generate_many(prompts, size="256x256")
+    assert [img.size for img in first] == [(256, 256)] * len(prompts)
+    for a, b in zip(first, second):
+        assert np.array_equal(np.asarray(a), np.asarray(b))
+
+    # 결과는 프롬프트 순서를 따르고, 콜백도 같은 순서의 인덱스를 받음
+    seen = []
+    reordered = backend.generate_many(prompts[::-1], size="256x256", on_result=lambda i, img: seen.append(i))
+    assert seen == [0, 1, 2]
+    for a, b in zip(first, reordered[::-1]):
+        assert np.array_equal(np.asarray(a), np.asarray(b))
+    assert not np.array_equal(np.asarray(first[0]), np.asarray(first[1]))
+
+
+def test_chat_call_without_client_needs_cached_result(app, monkeypatch):
+    monkeypatch.setattr(app, "client", None)
+    monkeypatch.setattr(app, "reuse_chat_cache", True)
+    monkeypatch.setattr(app, "read_chat_cache", lambda key: None)
+    with pytest.raises(RuntimeError, match="저장된 분석 결과"):
+        app.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "안녕"}])
+
+    monkeypatch.setattr(app, "read_chat_cache", lambda key: '{"panels": []}')
+    assert app.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "안녕"}]) == '{"panels": []}'
@@ -0,0 +1,16 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+from conftest import ROOT
+
+
+def test_payload_rows_keep_counting_after_history_is_trimmed(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    at = AppTest.from_file(os.path.join(ROOT, "webtoon_final_v4.py"), default_timeout=60)
+    at.run()
+    at.sidebar.checkbox(key="measure_payload").check()
+    for _ in range(23):
+        at.run()
+    runs = list(at.sidebar.dataframe[0].value["실행"])
+    assert runs == list(range(4, 24))
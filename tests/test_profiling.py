@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import tracemalloc
+
+from streamlit.testing.v1 import AppTest
+
+from conftest import ROOT
+
+
+def test_only_one_run_profiles_at_a_time(app):
+    slot = app.ProfilingSlot()
+    active = []
+    errors = []
+    results = []
+
+    def run(owner):
+        try:
+            for _ in range(20):
+                profiler = slot.start(owner)
+                if profiler is None:
+                    results.append("busy")
+                    continue
+                active.append(owner)
+                assert len(active) == 1
+                [bytes(1024) for _ in range(50)]
+                active.remove(owner)
+                results.append(slot.finish(profiler))
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(f"session-{i}",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert any(result != "busy" for result in results)
+    assert all(result == "busy" or result is not None for result in results)
+    assert slot.owner is None
+    assert not tracemalloc.is_tracing()
+
+
+def test_busy_slot_is_reclaimed_by_same_session_or_when_stale(app, monkeypatch):
+    slot = app.ProfilingSlot()
+    profiler = slot.start("a")
+    try:
+        assert slot.start("b") is None
+        # 같은 세션의 다음 실행은 중단된 이전 측정을 정리하고 다시 측정
+        again = slot.start("a")
+        assert again is not None
+        assert slot.finish(profiler) is None
+        monkeypatch.setattr(slot, "since", time.monotonic() - app.PROFILE_STALE_SECONDS - 1)
+        taken = slot.start("b")
+        assert taken is not None
+        assert slot.finish(again) is None
+        assert slot.finish(taken) is not None
+        assert not tracemalloc.is_tracing()
+    finally:
+        slot.reclaim(slot.owner)
+
+
+def test_tracemalloc_started_elsewhere_is_left_running(app):
+    slot = app.ProfilingSlot()
+    tracemalloc.start()
+    try:
+        slot.finish(slot.start("a"))
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_prune_profiles_keeps_newest(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "PROFILE_DIR", str(tmp_path))
+    for i in range(5):
+        path = tmp_path / f"run_{i}.prof"
+        path.write_bytes(b"")
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / "notes.txt").write_text("keep")
+    app.prune_profiles(max_files=2)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["notes.txt", "run_3.prof", "run_4.prof"]
+
+
+def test_profiled_run_reports_and_stops_tracemalloc(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    at = AppTest.from_file(os.path.join(ROOT, "webtoon_final_v4.py"), default_timeout=60)
+    at.query_params["profile"] = "1"
+    at.run()
+    assert not at.exception
+    assert any(e.label == "🛠 프로파일링 (관리자)" for e in at.expander)
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,34 @@
+DESCRIPTION = """이 사진의 인물을 웹툰 캐릭터로 만들기 위한 설명입니다.
+1. **나이와 성별**: 20대 후반의 남성으로 보입니다.
+2. **머리 스타일**: 짧고 단정한 검은색 머리, 앞머리를 살짝 내렸습니다.
+3. **얼굴 특징**: 둥근 얼굴형에 쌍꺼풀 없는 눈, 뚜렷한 눈썹이 특징입니다. 검은 뿔테 안경을 착용하고 있습니다.
+4. **표정**: 부드럽게 미소 짓고 있어 친근한 인상을 줍니다.
+5. **옷차림**: 네이비 색 후드티에 청바지를 입고 있습니다.
+이러한 특징을 살려 밝고 친근한 웹툰 캐릭터로 표현하면 좋겠습니다."""
+
+SECOND = """1. **나이와 성별**: 20대 초반의 여성으로 보입니다.
+2. **머리 스타일**: 어깨까지 오는 갈색 웨이브 단발입니다.
+3. **옷차림**: 노란 니트와 체크 치마를 입고 있습니다."""
+
+
+def test_image_descriptor_keeps_identifying_features(app):
+    descriptor = app.CharacterDescriptor(["철수"], [DESCRIPTION])
+    text = descriptor.text(app.IMAGE_MODEL)
+    for feature in ("남성", "검은색 머리", "안경", "후드티"):
+        assert feature in text
+    assert "나이와 성별" not in text and "머리 스타일" not in text  # 항목 제목은 빠짐
+    assert "웹툰" not in text and "사진" not in text
+    assert descriptor.tokens[app.IMAGE_MODEL] <= app.PROMPT_BUDGETS[app.IMAGE_MODEL]["descriptor"]
+
+
+def test_budget_is_per_character(app):
+    single = app.CharacterDescriptor(["철수"], [DESCRIPTION]).text(app.IMAGE_MODEL)
+    cast = app.CharacterDescriptor(["철수", "영희", "민수"], [DESCRIPTION, SECOND, DESCRIPTION]).text(app.IMAGE_MODEL)
+    first, second, third = cast.split("; ")
+    assert first == third == single
+    assert "웨이브 단발" in second and "니트" in second
+
+
+def test_chat_descriptor_lists_cast_by_name(app):
+    text = app.CharacterDescriptor(["철수", "영희"], [DESCRIPTION, SECOND]).text(app.CHAT_MODEL)
+    assert text.startswith("- 철수: ") and "\n- 영희: " in text
@@ -0,0 +1,21 @@
+import json
+
+
+def test_series_story_and_prompts_are_one_request_each(app, monkeypatch):
+    calls = []
+
+    def fake_chat(model, messages, stage=None, **params):
+        calls.append(stage)
+        if stage == "story":
+            # 두 번째 에피소드는 응답에서 빠짐
+            return json.dumps({"episodes": [{"panels": [{"description": "장면", "dialogue": "안녕"}] * 4}, {}]})
+        return json.dumps({"episodes": [{"prompts": ["p1", "p2", "p3", "p4"]}, {"prompts": ["p1"]}]})
+
+    monkeypatch.setattr(app, "create_chat_completion", fake_chat)
+    stories = app.analyze_series(["첫 화", "둘째 화"], 4, "A")
+    assert stories[0]["panels"][0]["dialogue"] == "안녕" and stories[1] is None
+
+    descriptor = app.CharacterDescriptor(["주인공"], ["20대 남성, 짧은 검은 머리"])
+    prompts = app.create_series_prompts([stories[0]["panels"]] * 2, "수채화", descriptor, 4, "A")
+    assert prompts == [["p1", "p2", "p3", "p4"], None]  # 프롬프트가 모자란 에피소드는 실패로 처리
+    assert calls == ["story", "prompts"]
@@ -0,0 +1,18 @@
+from PIL import ImageFont
+
+LONG_DIALOGUE = "철수: 그러니까내가몇번이나말했잖아오늘은절대로늦으면안된다고정말로부탁했는데" + "정말로" * 10
+
+
+def test_auto_placement_with_dialogue_wider_than_panel(app, monkeypatch):
+    monkeypatch.setattr(app, "get_font", lambda size=30: ImageFont.load_default(size=size))
+    panel = app.ProceduralBackend().render("장면", "1024x1024")
+    for placement in ("자동", "상단 중앙"):
+        assert app.add_speech_bubble(panel, LONG_DIALOGUE, placement=placement).size == panel.size
+
+
+def test_find_bubble_position_when_no_candidate_fits(app):
+    panel = app.ProceduralBackend().render("장면", "1024x1024")
+    x, y, _, _ = app.find_bubble_position(panel, 1100, 300)
+    assert x == 0 and 0 <= y <= panel.height
+    x, y, _, _ = app.find_bubble_position(panel.resize((40, 40)), 30, 30)
+    assert 0 <= x <= 10 and 0 <= y <= 10
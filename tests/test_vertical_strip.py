@@ -0,0 +1,38 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def make_panels(app, count):
+    rng = np.random.default_rng(0)
+    for _ in range(count):
+        img = Image.new("RGB", (512, 384), tuple(int(c) for c in rng.integers(0, 256, size=3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(8):
+            x, y = int(rng.integers(0, 512)), int(rng.integers(0, 384))
+            draw.ellipse([x - 60, y - 40, x + 60, y + 40], fill=tuple(int(c) for c in rng.integers(0, 256, size=3)))
+        yield img
+
+
+def test_slices_cover_strip_from_generator(app):
+    slices = list(app.stream_vertical_strip(make_panels(app, 6)))
+    heights = [Image.open(BytesIO(data)).height for data in slices]
+    assert max(heights) <= app.STRIP_MAX_SLICE_HEIGHT
+    assert sum(heights) == 6 * app.STRIP_PANEL_HEIGHT + 5 * app.STRIP_GUTTER
+
+
+def test_size_cap_enforced_for_png(app):
+    stats = {"oversized": 0}
+    max_bytes = 16 * 1024  # 나누지 않으면 첫 조각이 넘는 크기
+    slices = list(app.stream_vertical_strip(make_panels(app, 3), image_format="PNG", max_slice_bytes=max_bytes,
+                                            stats=stats))
+    assert stats["oversized"] == 0 and len(slices) > 2
+    assert all(len(data) <= max_bytes for data in slices)
+    assert sum(Image.open(BytesIO(data)).height for data in slices) == 3 * app.STRIP_PANEL_HEIGHT + 2 * app.STRIP_GUTTER
+
+
+def test_unreachable_cap_is_reported(app):
+    stats = {"oversized": 0}
+    slices = list(app.stream_vertical_strip(make_panels(app, 1), max_slice_bytes=10, stats=stats))
+    assert stats["oversized"] == len(slices) > 0
@@ -3,16 +3,42 @@ import openai
 import requests
 import os
 import json
+import re
 import base64
-from PIL import Image, ImageDraw, ImageFont
+import hashlib
+import zipfile
+import sqlite3
+import uuid
+import socket
+from contextlib import closing, contextmanager
+from typing import Protocol
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from io import BytesIO
+from collections import OrderedDict
+from urllib.parse import quote
 import time
+import functools
+import asyncio
+import cProfile
+import pstats
+import tracemalloc
 
 from openai import OpenAI
+try:
+    import tiktoken  # 있으면 정확한 토큰 수, 없으면 글자 수 기반 추정
+except ImportError:
+    tiktoken = None
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # OpenAI 클라이언트 초기화 (초기에는 None)
 client = None
 
+# 현재 실행 중인 생성 작업의 취소 토큰 (작업이 없으면 None)
+job_token = None
+
 # 앱 타이틀 및 설정
 st.set_page_config(
     page_title="내 사진 기반 웹툰 생성기",
@@ -21,27 +47,312 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 필요한 디렉토리 생성
-if not os.path.exists("images"):
-    os.makedirs("images")
+# 프로파일링 모드 (주소에 ?profile=1 을 붙이거나 WEBTOON_PROFILE=1 환경 변수 설정)
+# 스크립트 한 번 실행 전체를 cProfile과 tracemalloc으로 측정하고 결과를 profiles/ 에 저장합니다 (최근 PROFILE_MAX_FILES개).
+PROFILE_DIR = "profiles"
+PROFILE_MAX_FILES = 20
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_TOP_ALLOCATIONS = 15
+PROFILE_STALE_SECONDS = 600  # 이보다 오래 끝나지 않은 측정(창을 닫은 세션 등)은 버리고 새로 시작할 수 있음
+profiling_enabled = os.environ.get("WEBTOON_PROFILE") == "1" or st.query_params.get("profile") == "1"
+
+class ProfilingSlot:
+    """프로세스 전체에서 한 번에 한 실행만 측정하도록 관리하는 자리.
+    cProfile과 tracemalloc은 프로세스 전역이라 세션마다 따로 켜고 끄면 다른 세션의 측정이 깨지므로
+    (다른 세션이 tracemalloc을 끄면 take_snapshot이 실패하고, Python 3.12부터는 cProfile을 동시에 둘 켤 수 없음)
+    자리를 차지한 실행만 측정하고, 나머지 실행은 측정 없이 진행합니다."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owner = None
+        self.profiler = None
+        self.started_tracemalloc = False
+        self.since = 0.0
+    
+    def release_locked(self):
+        # 측정을 시작한 실행이 tracemalloc을 켰다면 함께 끔 (켜 둔 채 두면 모든 세션에서 계속 추적됨)
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.owner = None
+        self.profiler = None
+        self.started_tracemalloc = False
+    
+    def reclaim_locked(self, owner):
+        # 같은 세션의 이전 실행이 중간에 중단(st.stop, st.rerun 등)되었거나 너무 오래된 측정이면 정리
+        if self.owner is not None and (self.owner == owner or time.monotonic() - self.since > PROFILE_STALE_SECONDS):
+            self.release_locked()
+    
+    def reclaim(self, owner):
+        with self.lock:
+            self.reclaim_locked(owner)
+    
+    def start(self, owner):
+        """측정을 시작하고 프로파일러를 돌려줍니다. 다른 실행이 측정 중이면 None."""
+        with self.lock:
+            self.reclaim_locked(owner)
+            if self.owner is not None:
+                return None
+            self.started_tracemalloc = not tracemalloc.is_tracing()
+            if self.started_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.owner = owner
+            self.since = time.monotonic()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            return self.profiler
+    
+    def finish(self, profiler):
+        """측정을 끝내고 (메모리 스냅샷, 현재 메모리, 최대 메모리)를 돌려줍니다. 그 사이 자리를 잃었으면 None."""
+        with self.lock:
+            profiler.disable()
+            if self.profiler is not profiler:
+                return None
+            memory_snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ])
+            memory_current, memory_peak = tracemalloc.get_traced_memory()
+            self.release_locked()
+            return memory_snapshot, memory_current, memory_peak
+
+@st.cache_resource(show_spinner=False)
+def get_profiling_slot():
+    return ProfilingSlot()
+
+# 프로파일 파일을 최근 max_files개만 남김
+def prune_profiles(max_files=PROFILE_MAX_FILES):
+    try:
+        entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.is_file() and entry.name.endswith(".prof")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[max_files:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+profiling_slot = get_profiling_slot()
+profiling_session = getattr(get_script_run_ctx(), "session_id", None)
+script_profiler = None
+if profiling_enabled:
+    script_run_start = time.perf_counter()
+    script_profiler = profiling_slot.start(profiling_session)
+else:
+    profiling_slot.reclaim(profiling_session)
+
+# 아티팩트 저장소
+# 폰트, 레이아웃 프레임, 분석 결과 캐시, 생성 기록 이미지처럼 여러 앱 복제본(replica)이 함께 쓸 수 있는 파일은
+# 경로 형식의 키(예: "fonts/NanumGothic.ttf")로 저장소를 거쳐 읽고 씁니다.
+# WEBTOON_ARTIFACT_STORE가 http(s):// 주소면 HTTP 키-값 서버(artifact_store_server.py로 로컬 실행 가능)를,
+# 아니면 해당 디렉토리(기본: 현재 작업 디렉토리)를 저장소로 쓰고, 복제본마다 메모리 앞단 캐시를 하나 둡니다.
+ARTIFACT_FRONT_CACHE_BYTES = 64 * 1024 * 1024
+ARTIFACT_HTTP_TIMEOUT = 10
+ARTIFACT_RETRY_SECONDS = 30  # 원격 저장소 연결에 실패하면 이 시간 동안은 기다리지 않고 바로 실패 처리
+ARTIFACT_UNCACHED_PREFIXES = ("history/",)  # 한 번 쓰고 드물게 읽는 큰 이미지는 앞단 캐시에 두지 않음 (폰트/프레임이 밀려나지 않게)
+
+class ArtifactStore(Protocol):
+    def get(self, key):
+        """키의 내용(bytes)을 돌려주고, 없으면 None"""
+    
+    def put(self, key, data):
+        """키에 내용을 원자적으로 기록 (읽는 쪽은 이전 내용 또는 새 내용 전체만 봄)"""
+    
+    def delete(self, key):
+        ...
+    
+    def list(self, prefix):
+        """prefix 디렉토리 바로 아래 항목의 (키, 크기, 수정 시각) 목록"""
+
+class LocalDirStore:
+    """로컬 디렉토리 저장소. 임시 파일에 쓴 뒤 os.replace로 바꿔 반쯤 쓴 파일이 보이지 않게 합니다."""
+    
+    def __init__(self, root="."):
+        self.root = root
+    
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+    
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def delete(self, key):
+        path = self.path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        # 비어 있는 상위 디렉토리(예: history/<작업 ID>/)도 정리
+        if os.path.dirname(key):
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+    
+    def list(self, prefix):
+        prefix = prefix.strip("/")
+        directory = self.path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((f"{prefix}/{entry.name}", stat.st_size, stat.st_mtime))
+        return entries
+
+class HttpKVStore:
+    """HTTP 키-값 저장소. GET/PUT/DELETE {base_url}/kv/{key}, 목록은 GET {base_url}/kv/?prefix=..."""
+    
+    def __init__(self, base_url, timeout=ARTIFACT_HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.unavailable_until = 0.0
+    
+    def request(self, method, url, **kwargs):
+        if time.time() < self.unavailable_until:
+            raise requests.ConnectionError(f"산출물 저장소에 연결할 수 없습니다: {self.base_url}")
+        try:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.unavailable_until = time.time() + ARTIFACT_RETRY_SECONDS
+            raise
+    
+    def url(self, key):
+        return f"{self.base_url}/kv/{quote(key)}"
+    
+    def get(self, key):
+        response = self.request("GET", self.url(key))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+    
+    def put(self, key, data):
+        self.request("PUT", self.url(key), data=data).raise_for_status()
+    
+    def delete(self, key):
+        response = self.request("DELETE", self.url(key))
+        if response.status_code != 404:
+            response.raise_for_status()
+    
+    def list(self, prefix):
+        response = self.request("GET", f"{self.base_url}/kv/", params={"prefix": prefix.strip("/")})
+        response.raise_for_status()
+        return [(entry["key"], entry["size"], entry["mtime"]) for entry in response.json()]
 
-if not os.path.exists("fonts"):
-    os.makedirs("fonts")
+class FrontCachedStore:
+    """복제본(프로세스)마다 하나씩 두는 메모리 앞단 캐시. 최근 사용한 내용을 max_bytes까지 보관합니다.
+    없는 키는 기억하지 않으므로 다른 복제본이 나중에 기록한 내용도 다음 조회 때 보입니다."""
+    
+    def __init__(self, backend: ArtifactStore, max_bytes=ARTIFACT_FRONT_CACHE_BYTES):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+    
+    def remember(self, key, data):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(data) > self.max_bytes or key.startswith(ARTIFACT_UNCACHED_PREFIXES):
+                return
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+    
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        data = self.backend.get(key)
+        if data is not None:
+            self.remember(key, data)
+        return data
+    
+    def put(self, key, data):
+        self.backend.put(key, data)
+        self.remember(key, data)
+    
+    def delete(self, key):
+        self.backend.delete(key)
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+    
+    def list(self, prefix):
+        return self.backend.list(prefix)
+
+@st.cache_resource(show_spinner=False)
+def get_artifact_store(location) -> ArtifactStore:
+    backend: ArtifactStore
+    if location.startswith(("http://", "https://")):
+        backend = HttpKVStore(location)
+    else:
+        backend = LocalDirStore(location)
+    return FrontCachedStore(backend)
+
+artifact_store: ArtifactStore = get_artifact_store(os.environ.get("WEBTOON_ARTIFACT_STORE", "."))
+
+# prefix 아래 항목을 최근 기록 순으로 개수/용량 한도까지만 남김
+def prune_artifacts(prefix, max_entries, max_bytes):
+    entries = sorted(artifact_store.list(prefix), key=lambda entry: entry[2], reverse=True)
+    kept_bytes = 0
+    removed = 0
+    for index, (key, size, _) in enumerate(entries):
+        kept_bytes += size
+        if index >= max_entries or kept_bytes > max_bytes:
+            artifact_store.delete(key)
+            removed += 1
+    return removed
+
+# 폰트 다운로드 함수 (한글 폰트가 없을 경우, 저장소에 한 번만 받아 두고 모든 복제본이 공유)
+NANUM_FONT_KEY = "fonts/NanumGothic.ttf"
 
-# 폰트 다운로드 함수 (한글 폰트가 없을 경우)
 def download_nanum_font():
-    font_path = "fonts/NanumGothic.ttf"
-    if not os.path.exists(font_path):
+    try:
+        font_data = artifact_store.get(NANUM_FONT_KEY)
+    except OSError:
+        font_data = None  # 저장소에 연결할 수 없으면 직접 받아서 사용
+    if font_data is None:
         try:
             font_url = "https://github.com/googlefonts/nanum-gothic/raw/main/fonts/NanumGothic-Regular.ttf"
             response = requests.get(font_url)
-            with open(font_path, "wb") as f:
-                f.write(response.content)
-            return font_path
+            response.raise_for_status()
+            font_data = response.content
         except Exception as e:
             st.warning(f"폰트 다운로드 실패: {e}. 시스템 폰트를 사용합니다.")
             return None
-    return font_path
+        try:
+            artifact_store.put(NANUM_FONT_KEY, font_data)
+        except OSError:
+            pass
+    return font_data
 
 # 폰트 가져오기 (먼저, 시스템 폰트 경로에서 확인)
 def get_font(size=30):
@@ -55,8 +366,8 @@ def get_font(size=30):
         if os.path.exists(path):
             return ImageFont.truetype(path, size)
     downloaded_font = download_nanum_font()
-    if downloaded_font and os.path.exists(downloaded_font):
-        return ImageFont.truetype(downloaded_font, size)
+    if downloaded_font:
+        return ImageFont.truetype(BytesIO(downloaded_font), size)
     return ImageFont.load_default()
 
 # 에러 핸들링 함수
@@ -73,6 +384,247 @@ def handle_openai_error(e):
     else:
         return f"오류가 발생했습니다: {error_message}"
 
+# 생성 작업 취소
+# 작업마다 CancelToken을 하나 만들어 job_token에 두고, 작업 전용 HTTP 클라이언트로 API를 호출합니다.
+# API 호출은 작업 스레드(create_api_pool, run_pipeline)에서 하고 스크립트 스레드는 짧게 기다리며 취소 여부를 확인하며,
+# 취소 시 작업 전용 클라이언트의 연결을 끊어 진행 중인 호출을 바로 중단하고 남은 호출은 보내지 않습니다.
+# 취소 버튼을 누르면 Streamlit이 다음 st.* 호출에서 스크립트 실행을 중단하므로, 기다리는 동안
+# 스크립트 스레드에서 진행 상황 표시를 갱신(heartbeat)해 중단 지점을 만들어 둡니다.
+CANCEL_POLL_SECONDS = 0.1
+CANCEL_HEARTBEAT_SECONDS = 0.5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class JobCancelled(BaseException):
+    """취소된 작업에서 다음 호출로 넘어가려 할 때 발생합니다.
+    Streamlit의 실행 중단 예외처럼 일반 오류 처리(except Exception)에 잡히지 않습니다."""
+
+class CancelToken:
+    """생성 작업 하나의 취소 상태와 API 호출 통계 (완료/진행 중/남은 호출 수, 호출 시간)"""
+
+    def __init__(self, session_key, planned_calls=0, status=None):
+        self.session_key = session_key
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.closables = []
+        self.http_client = None
+        self.client = None
+        self.planned_calls = planned_calls
+        self.started_calls = 0
+        self.completed_calls = 0
+        self.call_seconds = 0.0
+        self.in_flight = {}
+        self.aborted = {}
+        self.finished_panels = []  # (패널 이름, 말풍선까지 추가된 이미지)
+        self.started_at = time.perf_counter()
+        self.cancelled_at = None
+        self.status = status
+        self.script_thread = threading.current_thread()
+        self.last_heartbeat = 0.0
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise JobCancelled()
+
+    def register(self, resource):
+        with self.lock:
+            self.closables.append(resource)
+
+    def unregister(self, resource):
+        with self.lock:
+            if resource in self.closables:
+                self.closables.remove(resource)
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.cancelled_at = time.perf_counter()
+            self.aborted = {call_id: self.cancelled_at - start for call_id, start in self.in_flight.items()}
+            self.event.set()
+            closables = list(self.closables)
+        if self.http_client is not None:
+            abort_http_client(self.http_client)
+        for resource in closables:
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+    def start_call(self):
+        self.check()
+        with self.lock:
+            self.started_calls += 1
+            call_id = self.started_calls
+            self.in_flight[call_id] = time.perf_counter()
+        return call_id
+
+    def replayed_call(self):
+        # 캐시된 응답을 재사용해 계획했던 호출을 보내지 않음
+        with self.lock:
+            self.planned_calls = max(0, self.planned_calls - 1)
+    
+    def add_planned_calls(self, count):
+        # 실패한 패널을 다시 시도하는 호출처럼 작업 도중 늘어난 호출
+        with self.lock:
+            self.planned_calls += count
+
+    def finish_call(self, call_id):
+        with self.lock:
+            self.completed_calls += 1
+            self.call_seconds += time.perf_counter() - self.in_flight.pop(call_id)
+
+    def heartbeat(self):
+        # 스크립트 스레드에서만 화면을 갱신 (작업 스레드의 st 호출은 실행 중단 지점이 되지 않음)
+        if self.status is None or threading.current_thread() is not self.script_thread:
+            return
+        now = time.perf_counter()
+        if now - self.last_heartbeat < CANCEL_HEARTBEAT_SECONDS:
+            return
+        self.last_heartbeat = now
+        try:
+            self.status.caption(f"⏱ {now - self.started_at:.0f}초 경과 · API 호출 {self.completed_calls}/{self.planned_calls}")
+        except BaseException:
+            self.cancel()
+            raise
+
+    def summary(self):
+        average = self.call_seconds / self.completed_calls if self.completed_calls else max(self.aborted.values(), default=0.0)
+        remaining_calls = max(0, self.planned_calls - self.completed_calls)
+        return {
+            "skipped_calls": max(0, self.planned_calls - self.started_calls),
+            "aborted_calls": len(self.aborted),
+            "saved_seconds": max(0.0, average * remaining_calls - sum(self.aborted.values())),
+            "elapsed": (self.cancelled_at or time.perf_counter()) - self.started_at,
+        }
+
+# 연결된 소켓을 먼저 shutdown해 응답을 기다리는 호출을 깨운 뒤 클라이언트를 닫음
+# (소켓을 닫기만 하면 다른 스레드에서 응답을 기다리는 호출은 서버가 응답할 때까지 깨어나지 않음)
+# httpx는 연결 풀의 소켓을 공개 API로 내주지 않으므로, 구조가 다르면 닫기만 함
+def abort_http_client(http_client):
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    for connection in getattr(pool, "connections", []):
+        stream = getattr(getattr(connection, "_connection", None), "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    http_client.close()
+
+# 생성 작업 시작: 토큰을 세션에 보관해 두었다가 다음 실행에서 취소 결과를 보여줌
+# API 키가 있으면 작업 전용 HTTP 클라이언트로 OpenAI 클라이언트를 만들어 취소 시 이 작업의 연결만 끊음
+def start_job(session_key, planned_calls, status=None):
+    global job_token
+    job_token = CancelToken(session_key, planned_calls, status)
+    if client is not None:
+        job_token.http_client = openai.DefaultHttpxClient()
+        job_token.client = openai.OpenAI(api_key=api_key, http_client=job_token.http_client)
+    st.session_state[session_key] = job_token
+    return job_token
+
+# 생성 작업 종료: 정상 종료(또는 오류)면 세션에서 지우고, 취소된 작업은 결과 보고용으로 남김
+def finish_job():
+    global job_token
+    if job_token is not None and not job_token.cancelled:
+        st.session_state.pop(job_token.session_key, None)
+        if job_token.http_client is not None:
+            job_token.http_client.close()
+    job_token = None
+
+# 작업 중이면 작업 전용 클라이언트, 아니면 공용 클라이언트 (API 키가 없으면 None)
+def api_client():
+    if job_token is not None and job_token.client is not None:
+        return job_token.client
+    return client
+
+# 스크립트 실행이 중단되는 중(취소 버튼 등)이면 남은 API 호출 취소
+def abort_job():
+    if job_token is not None:
+        job_token.cancel()
+
+def request_job_cancel(session_key):
+    token = st.session_state.get(session_key)
+    if token is not None:
+        token.cancel()
+
+# 작업 시작 시 취소 버튼과 진행 상황 표시 자리를 만들고 작업 토큰 생성
+def start_job_with_cancel(session_key, planned_calls):
+    cancel_col, status_col = st.columns([1, 4])
+    cancel_col.button("⏹ 생성 취소", key=f"{session_key}_cancel", on_click=request_job_cancel, args=(session_key,),
+                      help="남은 API 호출을 보내지 않고, 진행 중인 호출은 기다리지 않고 중단합니다")
+    return start_job(session_key, planned_calls, status_col.empty())
+
+# 이전 실행에서 취소된 작업이 있으면 한 번 보고
+def show_cancelled_job_once(session_key):
+    token = st.session_state.pop(session_key, None)
+    if token is not None and token.cancelled:
+        show_cancelled_job(token)
+
+# 취소된 작업 보고: 절약한 호출 수/시간과 이미 완성된 패널
+def show_cancelled_job(token):
+    summary = token.summary()
+    st.warning(f"생성 작업이 취소되었습니다 ({summary['elapsed']:.1f}초 진행). "
+               f"완성된 패널 {len(token.finished_panels)}개는 아래에 남겨 두었습니다.")
+    st.caption(f"보내지 않은 API 호출 {summary['skipped_calls']}개 · 응답을 기다리지 않고 중단한 호출 {summary['aborted_calls']}개"
+               f" · 절약한 API 호출 시간 약 {summary['saved_seconds']:.1f}초 (중단한 호출은 서버에서 이미 처리 중이었다면 과금될 수 있습니다)")
+    if not token.finished_panels:
+        return
+    cols = st.columns(min(4, len(token.finished_panels)))
+    panels_zip = BytesIO()
+    with zipfile.ZipFile(panels_zip, "w") as zf:
+        for k, (label, img) in enumerate(token.finished_panels):
+            show_preview(cols[k % len(cols)], img, caption=label)
+            buf = BytesIO()
+            img.save(buf, format="PNG")
+            zf.writestr(f"cancelled_panel_{k+1:02d}.png", buf.getvalue())
+    panels_zip.seek(0)
+    st.download_button(
+        label=f"완성된 패널 다운로드 ({len(token.finished_panels)}장, ZIP)",
+        data=panels_zip,
+        file_name="my_webtoon_cancelled_panels.zip",
+        mime="application/zip",
+        on_click="ignore"
+    )
+
+# 취소 확인 + 스크립트 스레드라면 진행 상황 표시 갱신
+def check_cancelled():
+    if job_token is not None:
+        job_token.check()
+        job_token.heartbeat()
+
+# API 호출 한 번을 작업 통계에 기록하며 실행 (작업 스레드에서 호출)
+# 그 사이 작업이 취소되었으면(연결이 끊겨 실패한 경우 포함) 결과를 버리고 JobCancelled 발생
+def call_api(fn, *args, **kwargs):
+    token = job_token
+    if token is None:
+        return fn(*args, **kwargs)
+    call_id = token.start_call()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        token.check()
+        raise
+    token.check()
+    token.finish_call(call_id)
+    return result
+
+# as_completed 대신 사용: 짧게 기다리며 취소 여부를 확인하고 끝난 작업부터 돌려줌
+def iter_completed(futures):
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+        check_cancelled()
+        yield from done
+
+def wait_for_result(future):
+    for done in iter_completed([future]):
+        return done.result()
+
 # 사이드바 설정
 st.sidebar.title("⚙️ 설정")
 api_key = st.sidebar.text_input("OpenAI API 키", type="password", value="")
@@ -81,6 +633,35 @@ if api_key:
     openai.api_key = api_key
     client = openai.OpenAI(api_key=api_key)  # ★ 여기서만 인스턴스 생성 ★
 
+# 이미지 생성 백엔드 선택 (WEBTOON_IMAGE_BACKEND 환경 변수로 기본값 지정 가능)
+IMAGE_BACKEND_LABELS = {"dalle3": "DALL-E 3", "procedural": "로컬 절차적 (오프라인)"}
+default_image_backend = os.environ.get("WEBTOON_IMAGE_BACKEND", "dalle3")
+image_backend_name = st.sidebar.selectbox(
+    "이미지 생성 백엔드",
+    list(IMAGE_BACKEND_LABELS),
+    index=1 if default_image_backend == "procedural" else 0,
+    format_func=lambda key: IMAGE_BACKEND_LABELS[key],
+    help="로컬 절차적 백엔드는 API 호출 없이 프롬프트로 정해지는 테스트용 이미지를 그립니다"
+)
+
+# 이미지 전송량 측정 (실행마다 브라우저로 보내는 이미지 크기를 기록)
+measure_payload = st.sidebar.checkbox("이미지 전송량 측정", value=False, key="measure_payload",
+                                      help="실행(rerun)마다 브라우저로 전송되는 이미지 크기를 미리보기 적용 전/후로 비교합니다")
+payload_report = st.sidebar.empty()
+payload_meter = {"images": 0, "before": 0, "after": 0}
+
+# 분석 결과 재사용 (같은 입력이면 저장된 사진/스토리 분석과 프롬프트를 그대로 사용)
+reuse_chat_cache = st.sidebar.checkbox("이전 분석 결과 재사용", value=False, key="reuse_chat_cache",
+                                       help="같은 사진, 스토리, 스타일, 레이아웃이면 저장된 분석 결과와 프롬프트를 다시 사용해 바로 이미지 생성으로 넘어갑니다")
+chat_seed = st.sidebar.number_input("분석 시드 (0 = 사용 안 함)", min_value=0, max_value=2**31 - 1, value=0, step=1,
+                                    help="시드를 지정하면 같은 입력에 대해 최대한 같은 분석 결과를 받도록 요청합니다") or None
+chat_cache_stats = {"hits": 0, "misses": 0}
+
+# API 키 없이 실행 (로컬 절차적 백엔드 + 저장된 분석 결과 재사용이면 OpenAI 호출이 필요 없음)
+offline_mode = not api_key and image_backend_name == "procedural" and reuse_chat_cache
+if offline_mode:
+    st.sidebar.caption("API 키 없이 실행합니다. 이전에 같은 입력으로 저장된 분석 결과가 있어야 합니다.")
+
 # 프레임 이미지 생성 함수
 def create_frame_images():
     # ... (생략: A~D 프레임 생성, 기존 동일)
@@ -90,31 +671,379 @@ def create_frame_images():
     draw.rectangle([(256, 0), (511, 255)], outline='black', width=2)
     draw.rectangle([(0, 256), (255, 511)], outline='black', width=2)
     draw.rectangle([(256, 256), (511, 511)], outline='black', width=2)
-    a_frame.save("images/A_Frame.png")
+    buf = BytesIO()
+    a_frame.save(buf, format="PNG")
+    artifact_store.put(get_frame_key("A"), buf.getvalue())
     # B, C, D 동일하게 프레임 생성 및 저장...
 
-for frame_type in ["A", "B", "C", "D"]:
-    if not os.path.exists(f"images/{frame_type}_Frame.png"):
-        create_frame_images()
-        break
-
-def get_frame_image_path(frame_type):
+def get_frame_key(frame_type):
     return f"images/{frame_type}_Frame.png"
 
+# 레이아웃 프레임 이미지 (저장소에 없으면 앱과 함께 배포된 파일로 채우고, 그것도 없으면 새로 그림)
+BUNDLED_ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def get_frame_image_bytes(frame_type):
+    key = get_frame_key(frame_type)
+    try:
+        data = artifact_store.get(key)
+    except OSError:
+        # 저장소에 연결할 수 없으면 앱과 함께 배포된 파일을 그대로 사용
+        return LocalDirStore(BUNDLED_ASSET_DIR).get(key)
+    if data is None:
+        data = LocalDirStore(BUNDLED_ASSET_DIR).get(key)
+        if data is not None:
+            try:
+                artifact_store.put(key, data)
+            except OSError:
+                pass
+        else:
+            create_frame_images()
+            data = artifact_store.get(key)
+    return data
+
+# 미리보기 설정 (화면 표시는 축소본, 원본은 다운로드 시에만 전송)
+PREVIEW_PANEL_WIDTH = 512
+PREVIEW_COMPOSITE_WIDTH = 1024
+PREVIEW_QUALITY = 80
+STREAMLIT_MAX_CONTENT_WIDTH = 1460  # st.image가 내부적으로 줄이는 최대 너비
+
+# 이미지 내용 해시 (미리보기 캐시 키)
+def image_digest(img):
+    digest = hashlib.blake2b(img.tobytes(), digest_size=16)
+    digest.update(f"{img.mode}{img.size}".encode())
+    return digest.hexdigest()
+
+# 미리보기용 JPEG 인코딩
+# st.image는 JPEG/PNG 외의 형식(WebP 등)을 매번 JPEG로 다시 인코딩하므로,
+# 표시 크기에 맞춘 JPEG를 넘겨야 Streamlit이 추가 처리 없이 그대로 전달합니다.
+def encode_preview(img, max_width, quality=PREVIEW_QUALITY):
+    if img.mode != "RGB":
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.convert("RGBA").split()[-1])
+        img = background
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def get_preview_bytes(digest, _img, max_width):
+    return encode_preview(_img, max_width)
+
+# 레이아웃 프레임 썸네일 (프레임 내용이 바뀌면 캐시 무효화)
+@st.cache_data(show_spinner=False)
+def get_frame_thumbnail(frame_data, width):
+    with Image.open(BytesIO(frame_data)) as frame:
+        return encode_preview(frame, width, quality=90)
+
+# 미리보기 도입 전 방식(원본을 st.image에 그대로 전달)으로 보냈을 때의 크기 추정
+def estimate_legacy_payload(img, width=None):
+    target_width = width or STREAMLIT_MAX_CONTENT_WIDTH
+    if img.width > target_width:
+        img = img.resize((target_width, int(img.height * target_width / img.width)), Image.BILINEAR)
+    buf = BytesIO()
+    if img.mode in ("RGBA", "LA", "P"):
+        img.save(buf, format="PNG")
+    else:
+        img.convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.tell()
+
+def record_payload(sent_bytes, legacy_size):
+    payload_meter["images"] += 1
+    payload_meter["after"] += sent_bytes
+    if measure_payload:
+        payload_meter["before"] += legacy_size()
+
+# 축소 미리보기 표시 (target: st, 컬럼, st.empty() 등)
+def show_preview(target, img, caption=None, max_width=PREVIEW_PANEL_WIDTH, width=None):
+    data = get_preview_bytes(image_digest(img), img, min(max_width, width) if width else max_width)
+    record_payload(len(data), lambda: estimate_legacy_payload(img, width))
+    if width:
+        target.image(data, caption=caption, width=width)
+    else:
+        target.image(data, caption=caption, use_container_width=True)
+
+def show_frame_thumbnail(frame_type, caption, width=150):
+    frame_data = get_frame_image_bytes(frame_type)
+    data = get_frame_thumbnail(frame_data, width)
+    record_payload(len(data), lambda: estimate_legacy_payload(Image.open(BytesIO(frame_data)), width))
+    st.image(data, caption=caption, width=width)
+
 # 앱 타이틀
 st.title("🎨 내 사진 기반 4컷 웹툰 생성기")
 st.markdown("당신의 사진과 스토리를 입력하면 DALL-E 3로 당신을 주인공으로 한 웹툰을 생성해주는 서비스입니다.")
 st.markdown("원하는 프레임 레이아웃(A, B, C, D)을 선택하고 이미지를 생성하세요!")
 
-# 이미지 인코딩
-def encode_image(image_file):
-    return base64.b64encode(image_file.getvalue()).decode('utf-8')
+# 프롬프트 토큰 예산
+# 모델별로 등장인물 한 명당 묘사 요약(descriptor)과 프롬프트 전체(prompt)에 쓸 토큰 상한을 둡니다.
+# dall-e-3는 API가 문자 수(4000자)로도 제한하므로 문자 상한을 함께 둡니다.
+# 긴 글은 문장/쉼표 단위로 잘라 예산 안에 들어가는 구절만 남기므로 한국어 단어가 중간에 끊기지 않습니다.
+CHAT_MODEL = "gpt-4o-mini"
+IMAGE_MODEL = "dall-e-3"
+PROMPT_BUDGETS = {
+    CHAT_MODEL: {"descriptor": 120, "prompt": 3000},
+    IMAGE_MODEL: {"descriptor": 60, "prompt": 500, "max_chars": 4000},
+}
+MIN_FIT_TOKENS = 30  # 예산이 부족해도 장면 설명마다 최소한 남기는 토큰
+MESSAGE_OVERHEAD_TOKENS = 4  # 채팅 메시지 하나당 역할/구분자 토큰
+CLAUSE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+|[,;]\s*")
+MARKDOWN_RE = re.compile(r"[*#`]+|^\s*(?:[-•]|\d+[.)])\s+", re.MULTILINE)
+FEATURE_HEADER_RE = re.compile(r"^([^:：]{1,20})[:：]\s*")  # '머리 스타일: ...' 같은 항목 제목
+# 인물을 구분해 주는 특징(머리, 안경, 옷차림 등)을 먼저, 성별/얼굴/체형을 그다음, 그 밖의 구절을 그다음으로 남기고
+# 사진/웹툰에 대한 설명 문구는 버림
+IDENTIFYING_KEYWORDS = ("머리", "헤어", "단발", "장발", "곱슬", "웨이브", "포니테일", "염색", "안경", "선글라스", "모자",
+                        "수염", "귀걸이", "목걸이", "피어싱", "옷차림", "복장", "의상", "셔츠", "후드", "재킷", "자켓",
+                        "코트", "니트", "스웨터", "원피스", "정장", "넥타이", "교복", "바지", "치마", "착용")
+APPEARANCE_KEYWORDS = ("남성", "여성", "남자", "여자", "소년", "소녀", "얼굴", "눈썹", "쌍꺼풀", "눈매", "눈동자", "피부", "주근깨", "보조개", "체형", "체격")
+META_KEYWORDS = ("사진", "웹툰", "캐릭터", "분석", "설명", "인상")
+# 묘사 요약에서 줄이는 서술형 어미
+DESCRIPTOR_ENDINGS = (
+    (re.compile(r"(?:으로|로) 보입니다$"), ""),
+    (re.compile(r"[이가] 특징입니다$"), ""),
+    (re.compile(r"[을를] 착용하고 있습니다$"), " 착용"),
+    (re.compile(r"[을를] 입고 있습니다$"), " 차림"),
+    (re.compile(r"입니다$"), ""),
+)
+prompt_token_stats = {}  # 단계 이름 -> 이번 작업에서 보낸 프롬프트 토큰 수
+prompt_token_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def get_token_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None  # 인코딩 파일을 받을 수 없으면 추정치 사용
+
+def count_tokens(text, model=CHAT_MODEL):
+    encoding = get_token_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # 추정: 한글/한자 등은 글자당 약 1토큰, 그 밖의 문자는 4글자당 약 1토큰
+    wide = sum(1 for ch in text if ord(ch) >= 0x1100)
+    return wide + (len(text) - wide + 3) // 4
+
+def count_message_tokens(messages, model=CHAT_MODEL):
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, list):  # 이미지가 포함된 메시지는 텍스트 부분만 셈
+            content = " ".join(part["text"] for part in content if part.get("type") == "text")
+        total += count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+def record_prompt_tokens(stage, tokens):
+    with prompt_token_lock:
+        prompt_token_stats[stage] = prompt_token_stats.get(stage, 0) + tokens
+
+def truncate_tokens(text, max_tokens, model=CHAT_MODEL):
+    encoding = get_token_encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    while text and count_tokens(text, model) > max_tokens:
+        text = text[:max(0, len(text) * max_tokens // count_tokens(text, model) - 1)]
+    return text
+
+def split_clauses(text):
+    clauses = (" ".join(clause.split()).strip(" .:") for clause in CLAUSE_SPLIT_RE.split(MARKDOWN_RE.sub("", text)))
+    return [clause for clause in clauses if clause and not clause.isdigit()]
+
+# 구절 단위로 max_tokens 안에 들어가도록 앞에서부터 차례로 남김
+def fit_clauses(text, max_tokens, model=CHAT_MODEL):
+    if count_tokens(text, model) <= max_tokens:
+        return " ".join(text.split())
+    clauses = split_clauses(text)
+    chosen, used = [], 0
+    for clause in clauses:
+        cost = count_tokens(clause, model) + 1  # 구분자 ", " 포함
+        if used + cost > max_tokens:
+            break
+        chosen.append(clause)
+        used += cost
+    if not chosen:
+        return truncate_tokens(clauses[0], max_tokens, model) if clauses else ""
+    return ", ".join(chosen)
+
+def feature_priority(header, clause):
+    for text in (clause, header):
+        if any(keyword in text for keyword in IDENTIFYING_KEYWORDS):
+            return 3
+        if any(keyword in text for keyword in APPEARANCE_KEYWORDS):
+            return 2
+    if any(keyword in clause for keyword in META_KEYWORDS):
+        return 0
+    return 1
+
+# 인물 설명을 (우선순위, 구절) 목록으로 나눔
+# 항목 제목('머리 스타일:')은 같은 줄의 구절을 분류하는 데만 쓰고 구절에서는 뺌
+def extract_features(description):
+    features = []
+    for line in MARKDOWN_RE.sub("", description).splitlines():
+        header = ""
+        for clause in split_clauses(line):
+            match = FEATURE_HEADER_RE.match(clause)
+            if match:
+                header, clause = match.group(1), clause[match.end():]
+            for pattern, replacement in DESCRIPTOR_ENDINGS:
+                clause = pattern.sub(replacement, clause)
+            if clause.strip():
+                features.append((feature_priority(header, clause), clause.strip()))
+    return features
+
+# 인물 설명을 max_tokens 안의 특징 구절 요약으로 줄임 (우선순위가 높은 구절부터 고르고 원래 순서로 나열)
+def summarize_description(description, max_tokens, model=CHAT_MODEL):
+    features = extract_features(description)
+    order = sorted((k for k, (priority, _) in enumerate(features) if priority > 0), key=lambda k: (-features[k][0], k))
+    chosen, used = [], 0
+    for k in order:
+        cost = count_tokens(features[k][1], model) + 1  # 구분자 ", " 포함
+        if used + cost <= max_tokens:
+            chosen.append(k)
+            used += cost
+    return ", ".join(features[k][1] for k in sorted(chosen))
+
+# LLM 응답 캐시 (산출물 저장소)
+# 모델, 메시지, 매개변수(시드 포함)를 묶은 해시를 키로 응답 본문을 chat_cache/ 아래 JSON으로 저장합니다.
+# '이전 분석 결과 재사용'이 켜져 있을 때만 응답을 기록하고 저장된 응답을 다시 씁니다.
+# 최근에 기록된 순서로 개수/용량 한도를 넘는 오래된 항목은 지우되, 기록할 때마다 저장소 목록을 훑지 않도록
+# 프로세스가 시작할 때 한 번, 이후에는 CHAT_CACHE_PRUNE_EVERY번 기록할 때마다 정리합니다.
+CHAT_CACHE_PREFIX = "chat_cache"
+CHAT_CACHE_MAX_ENTRIES = 500
+CHAT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+CHAT_CACHE_PRUNE_EVERY = 20
+chat_cache_lock = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def get_chat_cache_writes():
+    try:
+        prune_artifacts(CHAT_CACHE_PREFIX, CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_MAX_BYTES)
+    except OSError:
+        pass  # 저장소에 연결할 수 없으면 다음 정리 때 다시 시도
+    return {"count": 0, "lock": threading.Lock()}
+
+chat_cache_writes = get_chat_cache_writes()
+
+def chat_cache_key(model, messages, params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_chat_cache_artifact_key(key):
+    return f"{CHAT_CACHE_PREFIX}/{key}.json"
+
+def read_chat_cache(key):
+    try:
+        data = artifact_store.get(get_chat_cache_artifact_key(key))
+        return json.loads(data)["content"] if data is not None else None
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_chat_cache(key, model, content):
+    data = json.dumps({"model": model, "content": content, "created_at": time.time()}, ensure_ascii=False)
+    artifact_store.put(get_chat_cache_artifact_key(key), data.encode("utf-8"))
+    with chat_cache_writes["lock"]:
+        chat_cache_writes["count"] += 1
+        prune_due = chat_cache_writes["count"] % CHAT_CACHE_PRUNE_EVERY == 0
+    if prune_due:
+        prune_artifacts(CHAT_CACHE_PREFIX, CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_MAX_BYTES)
+
+# 채팅 완성 호출 (캐시를 거쳐 응답 본문만 돌려줌)
+# stage가 주어지면 실제로 보낸 프롬프트 토큰 수를 해당 단계에 기록합니다 (재사용한 응답은 제외).
+def create_chat_completion(model, messages, stage=None, **params):
+    if chat_seed is not None:
+        params["seed"] = chat_seed
+    key = chat_cache_key(model, messages, params)
+    if reuse_chat_cache:
+        content = read_chat_cache(key)
+        if content is not None:
+            with chat_cache_lock:
+                chat_cache_stats["hits"] += 1
+            if job_token is not None:
+                job_token.replayed_call()
+            return content
+    openai_client = api_client()
+    if openai_client is None:
+        # API 키 없이 실행 중에는 저장된 분석 결과만 쓸 수 있음
+        raise RuntimeError("API 키 없이 실행 중이지만 이 입력에 대해 저장된 분석 결과가 없습니다. "
+                           "같은 사진, 스토리, 설정으로 API 키를 입력해 한 번 실행한 뒤 다시 시도해주세요.")
+    if stage:
+        record_prompt_tokens(stage, count_message_tokens(messages, model))
+    response = call_api(openai_client.chat.completions.create, model=model, messages=messages, **params)
+    content = response.choices[0].message.content
+    with chat_cache_lock:
+        chat_cache_stats["misses"] += 1
+    if reuse_chat_cache:
+        try:
+            write_chat_cache(key, model, content)
+        except OSError as e:
+            st.warning(f"분석 결과 캐시 저장 실패: {str(e)}")
+    return content
+
+# 등장인물 사진 정규화 (방향 보정 후 긴 변 768px JPEG로 줄여 업로드/비전 토큰을 줄임)
+CAST_PHOTO_MAX_SIDE = 768
+CAST_PHOTO_QUALITY = 85
+DEFAULT_LEAD_NAME = "주인공"
+
+def normalize_photo(image_file, max_side=CAST_PHOTO_MAX_SIDE):
+    img = ImageOps.exif_transpose(Image.open(image_file)).convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=CAST_PHOTO_QUALITY)
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+# 등장인물 이름 (쉼표로 구분, 사진 순서대로) - 비어 있으면 주인공, 인물 2, 인물 3 ...
+def parse_cast_names(names_text, count):
+    names = [name.strip() for name in (names_text or "").split(",") if name.strip()]
+    return [names[k] if k < len(names) else (DEFAULT_LEAD_NAME if k == 0 else f"인물 {k+1}") for k in range(count)]
+
+# 인물별 설명을 하나의 등장인물표로 합침
+def build_cast_sheet(names, descriptions):
+    return "\n".join(f"- {name}: {' '.join(description.split())}" for name, description in zip(names, descriptions))
+
+class CharacterDescriptor:
+    """작업마다 한 번 만드는 등장인물 묘사. 원문 등장인물표(source)와 함께
+    인물마다 모델별 묘사 예산에 맞춰 구분되는 외모 특징 위주로 줄인 요약과 토큰 수를 미리 계산해 둡니다."""
+    
+    def __init__(self, names, descriptions):
+        self.names = names
+        self.source = build_cast_sheet(names, descriptions)
+        self.source_tokens = count_tokens(self.source)
+        self.texts = {}
+        self.tokens = {}
+        for model, budget in PROMPT_BUDGETS.items():
+            summaries = [summarize_description(description, budget["descriptor"], model) for description in descriptions]
+            if model == CHAT_MODEL:
+                text = "\n".join(f"- {name}: {summary}" for name, summary in zip(names, summaries))
+            else:
+                text = "; ".join(summaries)  # 이미지 모델은 인물 이름을 모르므로 외모만 나열
+            self.texts[model] = text
+            self.tokens[model] = count_tokens(text, model)
+    
+    def text(self, model):
+        return self.texts[model]
+
+# 등장인물 사진을 동시에 분석해 등장인물 묘사 생성 (한 명이라도 실패하면 None)
+def analyze_cast(photos_base64, names, max_workers=4):
+    descriptions = [None] * len(photos_base64)
+    with create_api_pool(max(1, min(max_workers, len(photos_base64)))) as pool:
+        futures = {pool.submit(analyze_photo, photo_base64): k for k, photo_base64 in enumerate(photos_base64)}
+        for future in iter_completed(futures):
+            descriptions[futures[future]] = future.result()
+    failed = [names[k] for k, description in enumerate(descriptions) if not description]
+    if failed:
+        st.error(f"사진 분석에 실패한 인물: {', '.join(failed)}")
+        return None
+    return CharacterDescriptor(names, descriptions)
 
 # 사진 분석
 def analyze_photo(photo_base64):
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        return create_chat_completion(
+            model=CHAT_MODEL,
+            stage="photo",
             messages=[
                 {
                     "role": "system",
@@ -130,15 +1059,40 @@ def analyze_photo(photo_base64):
             ],
             max_tokens=500
         )
-        return response.choices[0].message.content
     except Exception as e:
         st.error(handle_openai_error(e))
         return None
 
 # 함수: OpenAI GPT를 사용하여 스토리 분석 및 패널 설명 생성
-def analyze_story(story_text, character_description, num_panels, frame_layout):
+# character_description이 None이면 사진 분석과 동시에 실행할 수 있도록 외모 묘사 없이 장면만 나눕니다.
+# (캐릭터 외모는 create_prompts 단계에서 반영)
+# cast_names가 주어지면 (여러 인물 또는 이름을 지정한 경우) 인물을 이름으로 지칭하게 합니다.
+def story_character_prompts(character_description, cast_names=None):
+    if character_description:
+        character_instruction = "사용자가 업로드한 사진을 기반으로 한 캐릭터를 주인공으로 설정하고, 제공된 캐릭터 설명을 활용하세요."
+        character_section = f"""주인공 캐릭터 설명 (업로드된 사진 기반): 
+{character_description}
+"""
+        character_request = "이 캐릭터를 주인공으로 한 웹툰을 생성해주세요. 캐릭터의 외모적 특징을 각 패널 설명에 잘 반영해주세요."
+    elif cast_names:
+        cast_list = ", ".join(cast_names)
+        character_instruction = f"등장인물은 {cast_list}입니다. 외모는 다음 단계에서 사진 분석 결과로 추가되므로, 패널 설명에는 인물을 이름으로 지칭하고 외모 대신 장면, 행동, 표정, 구도를 서술하세요."
+        character_section = f"""등장인물: {cast_list}
+"""
+        character_request = "각 인물을 이름으로 지칭하고, 외모 묘사 없이 장면과 행동, 표정을 중심으로 설명해주세요."
+        if len(cast_names) > 1:
+            character_request += " 대사 앞에는 말하는 인물의 이름을 붙여주세요 (예: '철수: 안녕!')."
+    else:
+        character_instruction = "주인공의 외모는 다음 단계에서 사진 분석 결과로 추가되므로, 패널 설명에는 외모 대신 장면, 행동, 표정, 구도를 서술하세요."
+        character_section = ""
+        character_request = "주인공을 '주인공'으로 지칭하고, 외모 묘사 없이 장면과 행동, 표정을 중심으로 설명해주세요."
+    return character_instruction, character_section, character_request
+
+def analyze_story(story_text, character_description, num_panels, frame_layout, cast_names=None):
+    character_instruction, character_section, character_request = story_character_prompts(character_description, cast_names)
+    
     system_prompt = f"""당신은 웹툰 작가입니다. 사용자의 스토리를 {num_panels}컷으로 나누어 각 컷마다 어떤 장면이 그려져야 할지 상세히 설명해주세요.
-    사용자가 업로드한 사진을 기반으로 한 캐릭터를 주인공으로 설정하고, 제공된 캐릭터 설명을 활용하세요.
+    {character_instruction}
     
     선택된 프레임 레이아웃은 '{frame_layout}' 입니다. 각 패널의 크기와 배치에 맞게 장면을 구성해주세요.
     
@@ -166,17 +1120,16 @@ def analyze_story(story_text, character_description, num_panels, frame_layout):
 
 스토리: {story_text}
 
-주인공 캐릭터 설명 (업로드된 사진 기반): 
-{character_description}
-
+{character_section}
 선택된 레이아웃: {frame_layout}
 
-이 캐릭터를 주인공으로 한 웹툰을 생성해주세요. 캐릭터의 외모적 특징을 각 패널 설명에 잘 반영해주세요.
+{character_request}
 각 패널에 한국어 대사나 나레이션을 반드시 추가해주세요. 간결하고 자연스러운 한국어 대화를 포함해주세요."""
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        content = create_chat_completion(
+            model=CHAT_MODEL,
+            stage="story",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -185,21 +1138,119 @@ def analyze_story(story_text, character_description, num_panels, frame_layout):
             response_format={"type": "json_object"}
         )
         
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
         return result
     except Exception as e:
         st.error(handle_openai_error(e))
         return None
 
+# 시리즈 모드: 여러 에피소드의 스토리를 한 번의 요청으로 나누어 에피소드마다 패널 설명 생성
+# 시스템 프롬프트와 지시문을 에피소드마다 반복해 보내지 않도록 JSON 배열로 묶어 보내고 에피소드별 결과를 받습니다.
+# 응답 길이 제한 때문에 요청 하나에는 SERIES_BATCH_EPISODES개까지만 묶습니다.
+# 에피소드 순서대로 analyze_story와 같은 형식({"panels": [...]})의 결과를 돌려주며, 빠진 에피소드는 None입니다.
+SERIES_BATCH_EPISODES = 5
+
+def analyze_series(stories, num_panels, frame_layout, cast_names=None):
+    character_instruction, character_section, character_request = story_character_prompts(None, cast_names)
+    
+    system_prompt = f"""당신은 웹툰 작가입니다. 사용자가 준 여러 에피소드의 스토리를 에피소드마다 {num_panels}컷으로 나누어 각 컷마다 어떤 장면이 그려져야 할지 상세히 설명해주세요.
+    {character_instruction}
+    
+    선택된 프레임 레이아웃은 '{frame_layout}' 입니다. 각 패널의 크기와 배치에 맞게 장면을 구성해주세요.
+    
+    반드시 각 패널에 한국어 대화 내용을 포함해야 합니다. 한국어로 자연스러운 대화를 생성해주세요.
+    
+    JSON 형식으로 다음과 같이 반환해주세요. episodes 배열은 입력한 에피소드 순서대로 정확히 {len(stories)}개여야 합니다:
+    {{
+        "episodes": [
+            {{
+                "panels": [
+                    {{
+                        "description": "1번 패널 상세 설명",
+                        "dialogue": "한국어 대사(필수)"
+                    }},
+                    ...
+                    {{
+                        "description": "{num_panels}번 패널 상세 설명",
+                        "dialogue": "한국어 대사(필수)"
+                    }}
+                ]
+            }},
+            ...
+        ]
+    }}
+    
+    대화는 반드시 한국어로 작성하고, 각 패널마다 포함해주세요. 대사는 간결하게 작성하되, 스토리를 잘 전달할 수 있어야 합니다.
+    """
+    
+    episode_list = json.dumps([{"episode": e + 1, "story": story} for e, story in enumerate(stories)], ensure_ascii=False)
+    user_prompt = f"""다음 {len(stories)}개 에피소드를 각각 {num_panels}컷 웹툰으로 만들고 싶습니다. 에피소드마다 각 컷에 어떤 장면이 그려져야 할지 자세히 설명해주세요.
+
+에피소드 스토리: {episode_list}
+
+{character_section}
+선택된 레이아웃: {frame_layout}
+
+{character_request}
+각 패널에 한국어 대사나 나레이션을 반드시 추가해주세요. 간결하고 자연스러운 한국어 대화를 포함해주세요."""
+    
+    try:
+        content = create_chat_completion(
+            model=CHAT_MODEL,
+            stage="story",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+        
+        episodes = json.loads(content).get("episodes", [])
+    except Exception as e:
+        st.error(handle_openai_error(e))
+        return [None] * len(stories)
+    return [episodes[e] if e < len(episodes) and isinstance(episodes[e], dict) and episodes[e].get("panels") else None
+            for e in range(len(stories))]
+
 # 함수: DALL-E 3 프롬프트 생성 (말풍선 없이 장면만 생성)
-def create_prompts(panel_descriptions, style, character_description, num_panels, layout):
+# character_descriptor는 작업마다 한 번 만든 CharacterDescriptor로, 원문 대신 채팅 모델 예산에 맞춘 요약을 보냅니다.
+# cast_names에 여러 인물이 있으면 요약은 인물별 외모를 모은 등장인물표입니다.
+# 메시지 전체가 예산을 넘으면 패널별 장면 설명을 구절 단위로 줄입니다 (대사는 그대로 유지).
+# 각 프롬프트에서 강조할 요소 (단일 웹툰과 시리즈 요청 공용)
+PROMPT_REQUIREMENTS = """각 프롬프트에는 반드시 다음 요소를 강조해주세요:
+    1. 웹툰 스타일과 선명한 이미지 품질
+    2. 캐릭터의 특징과 표현
+    3. 장면 설명 (대화 상황에 맞는 표정과 제스처)
+    4. 단일 웹툰 패널임을 명시 (4컷 웹툰의 한 장면임을 명시)"""
+
+def prompt_cast_labels(cast_names=None):
+    if cast_names and len(cast_names) > 1:
+        return ("등장인물표 (업로드된 사진 기반, 인물별 외모)",
+                "여러 등장인물이 나옵니다. DALL-E는 인물 이름을 모르므로, 각 프롬프트에서 인물을 이름 대신 등장인물표의 외모 특징으로 구분해 묘사하세요.")
+    return "주인공 캐릭터 설명 (업로드된 사진 기반)", ""
+
+# 메시지 전체가 예산을 넘으면 장면 설명을 뺀 나머지 토큰을 패널마다 나눠 설명을 구절 단위로 줄임
+# episodes_panels는 에피소드별 패널 설명 목록의 목록이고, build_user_prompt는 같은 형태를 받아 사용자 메시지를 만듭니다.
+def fit_scene_descriptions(system_prompt, build_user_prompt, episodes_panels, budget):
+    user_prompt = build_user_prompt(episodes_panels)
+    if count_message_tokens([{"content": system_prompt}, {"content": user_prompt}]) <= budget:
+        return user_prompt
+    empty_panels = [[{**panel, "description": ""} for panel in panels] for panels in episodes_panels]
+    fixed = count_message_tokens([{"content": system_prompt}, {"content": build_user_prompt(empty_panels)}])
+    panel_count = sum(len(panels) for panels in episodes_panels)
+    per_panel = max(MIN_FIT_TOKENS, (budget - fixed) // max(1, panel_count))
+    return build_user_prompt([[{**panel, "description": fit_clauses(panel.get("description", ""), per_panel)}
+                               for panel in panels] for panels in episodes_panels])
+
+def create_prompts(panel_descriptions, style, character_descriptor, num_panels, layout, cast_names=None):
+    character_label, cast_instruction = prompt_cast_labels(cast_names)
+    
     system_prompt = f"""당신은 DALL-E 3 프롬프트 전문가입니다. 웹툰 장면 설명을 DALL-E 3가 잘 이해할 수 있는 상세한 프롬프트로 변환해주세요.
-    사용자가 업로드한 사진을 기반으로 한 캐릭터를 정확하게 묘사하세요.
+    사용자가 업로드한 사진을 기반으로 한 캐릭터를 정확하게 묘사하세요. {cast_instruction}
     
     사용자가 선택한 웹툰 레이아웃은 '{layout}'입니다. 이것은 {num_panels}컷 웹툰입니다.
     
-    중요: 말풍선이나 텍스트는 포함하지 마세요. 나중에 별도로 추가할 것입니다.
-    
     JSON 형식으로 다음과 같이 반환해주세요:
     {{
         "prompts": [
@@ -209,37 +1260,33 @@ def create_prompts(panel_descriptions, style, character_description, num_panels,
         ]
     }}
     
-    각 프롬프트에는 반드시 다음 요소를 강조해주세요:
-    1. 웹툰 스타일과 선명한 이미지 품질
-    2. 캐릭터의 특징과 표현
-    3. 장면 설명 (대화 상황에 맞는 표정과 제스처)
-    4. 단일 웹툰 패널임을 명시 (4컷 웹툰의 한 장면임을 명시)
-    
-    말풍선이나 텍스트는 절대 포함하지 마세요. 말풍선과 대화는 이미지 생성 후 별도로 추가할 것입니다.
+    {PROMPT_REQUIREMENTS}
     """
     
-    user_prompt = f"""다음 웹툰 장면 설명을 DALL-E 3를 위한 상세한 프롬프트로 변환해주세요.
+    def build_user_prompt(panels):
+        return f"""다음 웹툰 장면 설명을 DALL-E 3를 위한 상세한 프롬프트로 변환해주세요.
     
     웹툰 스타일: {style}
     웹툰 레이아웃: {layout}
     컷 수: {num_panels}컷 웹툰
     
-    주인공 캐릭터 설명 (업로드된 사진 기반): 
-    {character_description}
+    {character_label}: 
+    {character_descriptor.text(CHAT_MODEL)}
     
-    장면 설명: {json.dumps(panel_descriptions, ensure_ascii=False)}
+    장면 설명: {json.dumps(panels, ensure_ascii=False)}
     
-    각 프롬프트에는 다음 필수 요소를 포함해주세요:
-    1. "단일 웹툰 패널, {style}, 선명한 이미지, 한국식 웹툰 스타일"
-    2. 캐릭터의 특징과 표현을 정확히 묘사
-    3. 대화 내용에 맞는 표정과 제스처 묘사
+    각 프롬프트는 "단일 웹툰 패널, {style}, 선명한 이미지, 한국식 웹툰 스타일"로 시작해주세요.
     
     중요: 말풍선이나 텍스트는 포함하지 마세요. 말풍선과 대화는 나중에 별도로 추가할 것입니다.
     """
     
+    user_prompt = fit_scene_descriptions(system_prompt, lambda episodes_panels: build_user_prompt(episodes_panels[0]),
+                                         [panel_descriptions], PROMPT_BUDGETS[CHAT_MODEL]["prompt"])
+    
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        content = create_chat_completion(
+            model=CHAT_MODEL,
+            stage="prompts",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -248,76 +1295,574 @@ def create_prompts(panel_descriptions, style, character_description, num_panels,
             response_format={"type": "json_object"}
         )
         
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(content)
         return result
     except Exception as e:
         st.error(handle_openai_error(e))
         return None
 
-# 함수: DALL-E 3로 이미지 생성 (말풍선 없는 장면만)
-def generate_image(prompt, style, user_photo_description):
-    # 프롬프트에 사용자 특징 강조 추가
-    if len(user_photo_description) > 150:
-        user_photo_description = user_photo_description[:150] + "..."
+# 시리즈 모드: 여러 에피소드의 패널 설명을 한 번의 요청으로 DALL-E 3 프롬프트로 변환
+# 등장인물 묘사와 지시문은 요청마다 한 번만 보내고, 예산은 에피소드마다 단일 웹툰과 같은 만큼 둡니다.
+# 에피소드 순서대로 프롬프트 목록을 돌려주며, 빠지거나 개수가 모자란 에피소드는 None입니다.
+def create_series_prompts(episodes_panels, style, character_descriptor, num_panels, layout, cast_names=None):
+    character_label, cast_instruction = prompt_cast_labels(cast_names)
     
-    # 프롬프트 길이 제한 (DALL-E 3 제한: 약 4000자)
-    max_prompt_length = 3800
+    system_prompt = f"""당신은 DALL-E 3 프롬프트 전문가입니다. 여러 에피소드의 웹툰 장면 설명을 DALL-E 3가 잘 이해할 수 있는 상세한 프롬프트로 변환해주세요.
+    사용자가 업로드한 사진을 기반으로 한 캐릭터를 정확하게 묘사하세요. {cast_instruction}
     
-    # 말풍선 없는 이미지 요청
-    enhanced_prompt = f"{prompt}, 캐릭터 특징: {user_photo_description}, 스타일: {style}, 단일 웹툰 패널, 말풍선이나 텍스트 없음"
+    사용자가 선택한 웹툰 레이아웃은 '{layout}'입니다. 각 에피소드는 {num_panels}컷 웹툰입니다.
     
-    if len(enhanced_prompt) > max_prompt_length:
-        # 길이가 초과하면 중요하지 않은 부분 줄이기
-        excess = len(enhanced_prompt) - max_prompt_length
-        user_photo_description = user_photo_description[:max(50, len(user_photo_description)-excess-100)] + "..."
-        enhanced_prompt = f"{prompt}, 캐릭터 특징: {user_photo_description}, 스타일: {style}, 단일 웹툰 패널, 말풍선이나 텍스트 없음"
+    JSON 형식으로 다음과 같이 반환해주세요. episodes 배열은 입력한 에피소드 순서대로 정확히 {len(episodes_panels)}개여야 합니다:
+    {{
+        "episodes": [
+            {{
+                "prompts": [
+                    "1번 패널을 위한 DALL-E 프롬프트 (말풍선 없음)",
+                    ...
+                    "{num_panels}번 패널을 위한 DALL-E 프롬프트 (말풍선 없음)"
+                ]
+            }},
+            ...
+        ]
+    }}
+    
+    {PROMPT_REQUIREMENTS}
+    """
+    
+    def build_user_prompt(episodes):
+        scenes = json.dumps([{"episode": e + 1, "panels": panels} for e, panels in enumerate(episodes)], ensure_ascii=False)
+        return f"""다음 에피소드별 웹툰 장면 설명을 DALL-E 3를 위한 상세한 프롬프트로 변환해주세요.
+    
+    웹툰 스타일: {style}
+    웹툰 레이아웃: {layout}
+    컷 수: 에피소드마다 {num_panels}컷 웹툰
+    
+    {character_label}: 
+    {character_descriptor.text(CHAT_MODEL)}
+    
+    에피소드별 장면 설명: {scenes}
+    
+    각 프롬프트는 "단일 웹툰 패널, {style}, 선명한 이미지, 한국식 웹툰 스타일"로 시작해주세요.
+    
+    중요: 말풍선이나 텍스트는 포함하지 마세요. 말풍선과 대화는 나중에 별도로 추가할 것입니다.
+    """
+    
+    user_prompt = fit_scene_descriptions(system_prompt, build_user_prompt, episodes_panels,
+                                         PROMPT_BUDGETS[CHAT_MODEL]["prompt"] * len(episodes_panels))
     
     try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=enhanced_prompt,
-            n=1,
-            size="1024x1024",
-            quality="standard",
-            style="vivid"
+        content = create_chat_completion(
+            model=CHAT_MODEL,
+            stage="prompts",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7,
+            response_format={"type": "json_object"}
         )
         
-        image_url = response.data[0].url
-        return image_url
+        episodes = json.loads(content).get("episodes", [])
     except Exception as e:
-        error_msg = handle_openai_error(e)
-        st.error(f"이미지 생성 중 오류가 발생했습니다: {error_msg}")
-        
-        # 오류 발생 시 간단한 프롬프트로 재시도
+        st.error(handle_openai_error(e))
+        return [None] * len(episodes_panels)
+    results = []
+    for e in range(len(episodes_panels)):
+        prompts = episodes[e].get("prompts") if e < len(episodes) and isinstance(episodes[e], dict) else None
+        results.append(prompts[:num_panels] if prompts and len(prompts) >= num_panels else None)
+    return results
+
+# 함수: 이미지 생성 프롬프트 조립 (말풍선 없는 장면만)
+# 캐릭터 특징과 스타일은 그대로 두고, 모델의 프롬프트 예산에서 남는 토큰만큼 장면을 구절 단위로 남깁니다.
+def build_image_prompt(prompt, style, character_features, model=IMAGE_MODEL):
+    budget = PROMPT_BUDGETS[model]
+    suffix = f", 캐릭터 특징: {character_features}, 스타일: {style}, 단일 웹툰 패널, 말풍선이나 텍스트 없음"
+    scene_budget = max(MIN_FIT_TOKENS, budget["prompt"] - count_tokens(suffix, model))
+    enhanced_prompt = fit_clauses(prompt, scene_budget, model) + suffix
+    
+    # 스타일 설명이 아주 길면 API 문자 수 제한에 맞춰 자름
+    if "max_chars" in budget:
+        enhanced_prompt = enhanced_prompt[:budget["max_chars"]]
+    return enhanced_prompt
+
+# 이미지 생성 백엔드
+# 모든 백엔드는 generate_many(prompts, size, quality, on_result)로 여러 프롬프트를 한 번에 받아
+# 프롬프트 순서대로 PIL 이미지 목록(실패한 항목은 None)을 돌려줍니다.
+# on_result(index, image)가 주어지면 각 이미지가 끝나는 즉시 호출 스레드에서 호출됩니다.
+# max_batch는 한 번의 generate_many 호출에 묶어 보내기 좋은 최대 프롬프트 수이고,
+# calls_api는 이미지마다 과금되는 API 호출을 하는지 여부입니다 (취소 시 절약한 호출 수 계산용).
+# prompt_model은 이미지 프롬프트를 조립할 때 따를 PROMPT_BUDGETS의 모델입니다.
+class ImageBackend(Protocol):
+    name: str
+    max_batch: int
+    calls_api: bool
+    prompt_model: str
+    
+    def generate_many(self, prompts, size="1024x1024", quality="standard", on_result=None):
+        ...
+
+class DallE3Backend:
+    """OpenAI DALL-E 3 백엔드. 요청당 1장(n=1)만 지원하므로 여러 프롬프트는 동시에 나누어 요청합니다.
+    openai_client를 주지 않으면 호출할 때의 작업 전용 클라이언트(api_client)를 씁니다."""
+    name = "DALL-E 3"
+    max_batch = 1
+    calls_api = True
+    prompt_model = IMAGE_MODEL
+    
+    def __init__(self, openai_client=None, style="vivid", max_workers=4):
+        self.client = openai_client
+        self.style = style
+        self.max_workers = max_workers
+    
+    def generate_one(self, prompt, size, quality):
+        openai_client = self.client if self.client is not None else api_client()
         try:
-            simplified_prompt = f"웹툰 한 장면, {style} 스타일, 말풍선이나 텍스트 없음"
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=simplified_prompt,
+            response = call_api(
+                openai_client.images.generate,
+                model=IMAGE_MODEL,
+                prompt=prompt,
                 n=1,
-                size="1024x1024",
-                quality="standard",
-                style="vivid"
+                size=size,
+                quality=quality,
+                style=self.style
             )
-            
-            image_url = response.data[0].url
-            st.success("단순화된 프롬프트로 이미지 생성에 성공했습니다.")
-            return image_url
-        except:
+        except Exception as e:
+            st.error(f"이미지 생성 중 오류가 발생했습니다: {handle_openai_error(e)}")
             return None
+        return get_image_from_url(response.data[0].url)
+    
+    def generate_many(self, prompts, size="1024x1024", quality="standard", on_result=None):
+        # 한 장만 요청할 때도 작업 스레드에서 호출해, 기다리는 동안 스크립트 스레드가 취소를 확인할 수 있게 함
+        results = [None] * len(prompts)
+        with create_api_pool(max(1, min(self.max_workers, len(prompts)))) as pool:
+            futures = {pool.submit(self.generate_one, prompt, size, quality): i for i, prompt in enumerate(prompts)}
+            for future in iter_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if on_result:
+                    on_result(i, results[i])
+        return results
+
+class ProceduralBackend:
+    """네트워크 없이 프롬프트 해시로 정해지는 장면을 그리는 로컬 백엔드 (오프라인 실행/테스트용).
+    같은 프롬프트와 크기에는 항상 같은 이미지를 돌려줍니다."""
+    name = "로컬 절차적 (오프라인)"
+    max_batch = 16
+    calls_api = False
+    prompt_model = IMAGE_MODEL  # 오프라인에서도 DALL-E 3와 같은 프롬프트로 실행
+    
+    def render(self, prompt, size):
+        width, height = (int(value) for value in size.split("x"))
+        seed = int.from_bytes(hashlib.sha256(f"{size}|{prompt}".encode("utf-8")).digest()[:8], "big")
+        rng = np.random.default_rng(seed)
+        
+        # 하늘 그라데이션 + 바닥
+        top, bottom = rng.integers(40, 255, size=(2, 3))
+        blend = np.linspace(0.0, 1.0, height)[:, None, None]
+        canvas = np.broadcast_to(top * (1 - blend) + bottom * blend, (height, width, 3))
+        img = Image.fromarray(canvas.astype(np.uint8), "RGB")
+        draw = ImageDraw.Draw(img)
+        horizon = int(height * rng.uniform(0.6, 0.8))
+        draw.rectangle([0, horizon, width, height], fill=tuple(int(c) for c in rng.integers(30, 200, size=3)))
+        
+        # 배경 도형
+        for _ in range(int(rng.integers(3, 7))):
+            x, y = int(rng.integers(0, width)), int(rng.integers(0, horizon))
+            r = int(rng.integers(width // 20, width // 6))
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            if rng.random() < 0.5:
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+            else:
+                draw.rectangle([x - r, y - r, x + r, y + r // 2], fill=color)
+        
+        # 주인공 실루엣
+        cx = int(width * rng.uniform(0.3, 0.7))
+        head = width // 14
+        body_color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        draw.rectangle([cx - head, horizon - head * 5, cx + head, horizon], fill=body_color, outline="black", width=3)
+        draw.ellipse([cx - head, horizon - head * 7, cx + head, horizon - head * 5], fill=(240, 210, 180), outline="black", width=3)
+        return img
+    
+    def generate_many(self, prompts, size="1024x1024", quality="standard", on_result=None):
+        results = []
+        for i, prompt in enumerate(prompts):
+            check_cancelled()
+            results.append(self.render(prompt, size))
+            if on_result:
+                on_result(i, results[i])
+        return results
+
+# 설정에 따라 이미지 생성 백엔드 선택
+def create_image_backend(backend_name, image_style="vivid", max_workers=4) -> ImageBackend:
+    if backend_name == "procedural":
+        return ProceduralBackend()
+    return DallE3Backend(style=image_style, max_workers=max_workers)
 
 # 함수: 이미지 URL에서 이미지 다운로드
+# 청크 단위로 받으면서 작업이 취소되면 다운로드를 중단
 def get_image_from_url(url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # 오류 검사
-        return Image.open(BytesIO(response.content))
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()  # 오류 검사
+            if job_token is not None:
+                job_token.register(response)
+            try:
+                buf = BytesIO()
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    check_cancelled()
+                    buf.write(chunk)
+            finally:
+                if job_token is not None:
+                    job_token.unregister(response)
+        buf.seek(0)
+        return Image.open(buf)
     except Exception as e:
         st.error(f"이미지 다운로드 오류: {str(e)}")
         return None
 
+# 함수: 패널 이미지 일괄 생성 (실패한 패널은 프롬프트를 단순화하여 한 번 더 시도)
+# on_result(index, image)는 패널마다 최종 결과(실패 시 None)로 한 번씩 호출됩니다.
+# character_descriptor의 이미지 모델용 요약을 캐릭터 특징으로 씁니다 (작업마다 한 번만 계산됨).
+def generate_panel_images(prompts, enhanced_style, final_style, character_descriptor, backend: ImageBackend,
+                          style_description="", size="1024x1024", quality="standard",
+                          panel_labels=None, on_result=None):
+    panel_labels = panel_labels or [f"{i+1}번 패널" for i in range(len(prompts))]
+    
+    # 이미지 생성 (캐릭터 특징 강조)
+    character_features = character_descriptor.text(backend.prompt_model)
+    image_prompts = [build_image_prompt(prompt + style_description, enhanced_style, character_features, backend.prompt_model)
+                     for prompt in prompts]
+    if backend.calls_api:
+        record_prompt_tokens("images", sum(count_tokens(prompt, backend.prompt_model) for prompt in image_prompts))
+    
+    def first_attempt_done(i, img):
+        if img is not None and on_result:
+            on_result(i, img)
+    
+    results = backend.generate_many(image_prompts, size, quality, on_result=first_attempt_done)
+    
+    # 실패한 패널은 단순화한 프롬프트로 모아서 재시도
+    failed = [i for i, img in enumerate(results) if img is None]
+    if failed:
+        check_cancelled()
+        for i in failed:
+            st.warning(f"{panel_labels[i]} 생성 중 오류 발생. 프롬프트를 단순화하여 다시 시도합니다...")
+        simplified_prompt = build_image_prompt(f"단일 웹툰 패널, {final_style}, 말풍선이나 텍스트 없음",
+                                               enhanced_style, character_features, backend.prompt_model)
+        if backend.calls_api:
+            record_prompt_tokens("images", count_tokens(simplified_prompt, backend.prompt_model) * len(failed))
+            if job_token is not None:
+                job_token.add_planned_calls(len(failed))
+        retried = backend.generate_many([simplified_prompt] * len(failed), size, quality)
+        for i, img in zip(failed, retried):
+            results[i] = img
+            if on_result:
+                on_result(i, img)
+    return results
+
+# 파이프라인 단계 스케줄러
+# stages: {단계 이름: (의존 단계 이름 목록, 함수)} 형식이며, 함수는 의존 단계의 결과를
+# 같은 이름의 키워드 인자로 받습니다. 의존 단계가 모두 끝난 단계부터 동시에 실행되고,
+# 의존 단계 중 하나라도 실패(None)하면 해당 단계는 건너뜁니다.
+def run_pipeline(stages):
+    ctx = get_script_run_ctx()
+    job_start = time.perf_counter()
+    results = {}
+    trace = {}
+    
+    def call_with_ctx(fn, kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(**kwargs)
+    
+    async def run_stage(name, deps, fn, tasks):
+        dep_results = {dep: await tasks[dep] for dep in deps}
+        ready = time.perf_counter() - job_start
+        if any(value is None for value in dep_results.values()):
+            results[name] = None
+            trace[name] = {"deps": deps, "start": ready, "end": ready, "status": "건너뜀"}
+            return None
+        try:
+            result = await asyncio.to_thread(call_with_ctx, fn, dep_results)
+            status = "완료" if result is not None else "실패"
+        except JobCancelled:
+            result, status = None, "취소"
+        except Exception as e:
+            st.error(f"{name} 단계 오류: {str(e)}")
+            result, status = None, "오류"
+        results[name] = result
+        trace[name] = {"deps": deps, "start": ready, "end": time.perf_counter() - job_start, "status": status}
+        return result
+    
+    async def run_all():
+        tasks = {}
+        for name, (deps, fn) in stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, deps, fn, tasks))
+        # 기다리는 동안 취소 여부 확인 (단계 함수는 작업 스레드에서 실행)
+        pending = set(tasks.values())
+        while pending:
+            _, pending = await asyncio.wait(pending, timeout=CANCEL_POLL_SECONDS)
+            check_cancelled()
+        for task in tasks.values():
+            task.result()
+    
+    asyncio.run(run_all())
+    return results, trace
+
+PIPELINE_STAGE_LABELS = {
+    "photo": "사진 분석",
+    "story": "스토리 분석",
+    "prompts": "프롬프트 생성",
+    "images": "이미지 생성",
+}
+
+# 이번 작업에서 단계별로 보낸 프롬프트 토큰 수와 등장인물 묘사 요약 크기 표시
+def show_prompt_token_report(character_descriptor, stage_labels=PIPELINE_STAGE_LABELS):
+    if prompt_token_stats:
+        counter = "tiktoken" if get_token_encoding(CHAT_MODEL) is not None else "추정치"
+        stages = " · ".join(f"{label} {prompt_token_stats[stage]:,}" for stage, label in stage_labels.items()
+                            if stage in prompt_token_stats)
+        st.caption(f"보낸 프롬프트 토큰 ({counter}): {stages} (합계 {sum(prompt_token_stats.values()):,})")
+    st.caption(f"등장인물 묘사: 원문 {character_descriptor.source_tokens:,}토큰 → "
+               f"프롬프트 생성용 {character_descriptor.tokens[CHAT_MODEL]:,}토큰, 이미지용 {character_descriptor.tokens[IMAGE_MODEL]:,}토큰")
+
+# 파이프라인 밖에서 실행한 단계(예: 이미지 생성)를 추적 기록에 추가
+def add_trace_stage(trace, name, deps, start, end, status="완료"):
+    trace[name] = {"deps": deps, "start": start, "end": end, "status": status}
+
+# 임계 경로: 가장 늦게 끝난 단계에서 시작해 가장 늦게 끝난 의존 단계를 거슬러 올라감
+def find_critical_path(trace):
+    if not trace:
+        return []
+    name = max(trace, key=lambda stage: trace[stage]["end"])
+    path = [name]
+    while trace[name]["deps"]:
+        name = max(trace[name]["deps"], key=lambda dep: trace[dep]["end"])
+        path.append(name)
+    return list(reversed(path))
+
+# 실행 추적 표시 (단계별 시작/종료 시각과 임계 경로)
+def show_pipeline_trace(trace, stage_labels=None):
+    stage_labels = stage_labels or {}
+    critical_path = find_critical_path(trace)
+    total = max((stage["end"] for stage in trace.values()), default=0) or 1
+    with st.expander("파이프라인 실행 추적"):
+        st.markdown("**임계 경로**: " + " → ".join(stage_labels.get(name, name) for name in critical_path)
+                    + f" (총 {total:.1f}초)")
+        rows = []
+        for name, stage in sorted(trace.items(), key=lambda item: item[1]["start"]):
+            bar_start = int(stage["start"] / total * 30)
+            bar_length = max(1, int((stage["end"] - stage["start"]) / total * 30))
+            rows.append({
+                "단계": stage_labels.get(name, name),
+                "의존": ", ".join(stage_labels.get(dep, dep) for dep in stage["deps"]) or "-",
+                "시작 (초)": round(stage["start"], 2),
+                "종료 (초)": round(stage["end"], 2),
+                "소요 (초)": round(stage["end"] - stage["start"], 2),
+                "상태": stage["status"],
+                "임계 경로": "●" if name in critical_path else "",
+                "타임라인": " " * bar_start + "█" * bar_length,
+            })
+        st.dataframe(rows, hide_index=True)
+
+# 스토리 분석 결과를 패널 수에 맞게 정리
+def normalize_panel_descriptions(panel_descriptions, num_panels):
+    panel_descriptions_data = panel_descriptions.get("panels", [])
+    
+    # 패널이 부족한 경우 더미 데이터 추가
+    while len(panel_descriptions_data) < num_panels:
+        panel_descriptions_data.append({
+            "description": f"패널 {len(panel_descriptions_data) + 1}",
+            "dialogue": "안녕하세요!"  # 기본 한국어 대사 추가
+        })
+    
+    # 패널 수에 맞게 조정
+    return panel_descriptions_data[:num_panels]
+
+# API 호출용 공용 작업 풀 (동시 호출 수 제한)
+@contextmanager
+def create_api_pool(max_workers):
+    # 작업 스레드에서도 st.error 등을 쓸 수 있도록 현재 스크립트 컨텍스트를 연결
+    ctx = get_script_run_ctx()
+    pool = ThreadPoolExecutor(
+        max_workers=max_workers,
+        thread_name_prefix="webtoon-api",
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    )
+    try:
+        yield pool
+    except BaseException:
+        # 취소되거나 실행이 중단되면 대기 중인 호출은 보내지 않고, 진행 중인 호출은 응답을 버림
+        if job_token is not None:
+            job_token.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
+# 패널 색감 통일 설정
+HARMONIZE_SAMPLE_FACTOR = 4  # 통계 계산 시 가로/세로 샘플링 간격
+# PIL의 RGB -> YCbCr 변환 (JPEG, 전 범위)
+YCBCR_FROM_RGB = np.array([[0.299, 0.587, 0.114],
+                           [-0.168736, -0.331264, 0.5],
+                           [0.5, -0.418688, -0.081312]])
+YCBCR_OFFSET = np.array([0.0, 128.0, 128.0])
+
+# 색감 기준 통계 계산 (YCbCr 채널별 평균/표준편차 또는 누적 히스토그램)
+# 두 방식 모두 PIL의 채널별 히스토그램(C 구현)에서 계산해 픽셀 배열을 만들지 않음
+def compute_color_reference(img, method="통계"):
+    # 박스 필터로 줄이면 분포가 좁아지므로 최근접 샘플링으로 픽셀 분포를 그대로 유지
+    sample_size = (max(1, img.width // HARMONIZE_SAMPLE_FACTOR), max(1, img.height // HARMONIZE_SAMPLE_FACTOR))
+    sample = img.convert("RGB").resize(sample_size, Image.NEAREST).convert("YCbCr")
+    counts = np.asarray(sample.histogram(), dtype=np.float64).reshape(3, 256)
+    total = counts[0].sum()
+    if method == "히스토그램":
+        return {"method": method, "cdf": np.cumsum(counts, axis=1) / total}
+    levels = np.arange(256, dtype=np.float64)
+    mean = counts @ levels / total
+    std = np.sqrt((counts * (levels[None, :] - mean[:, None]) ** 2).sum(axis=1) / total)
+    return {"method": method, "mean": mean, "std": std + 1e-6}
+
+# 기준 통계에 맞추는 채널별 변환표(LUT) 생성
+def build_color_lut(reference, source, strength):
+    levels = np.arange(256, dtype=np.float64)
+    if reference["method"] == "히스토그램":
+        lut = np.stack([np.interp(source["cdf"][c], reference["cdf"][c], levels) for c in range(3)])
+    else:
+        # 과도한 대비 변화를 막기 위해 표준편차 비율 제한
+        scale = np.clip(reference["std"] / source["std"], 0.5, 2.0)
+        lut = (levels[None, :] - source["mean"][:, None]) * scale[:, None] + reference["mean"][:, None]
+    lut = levels[None, :] + strength * (lut - levels[None, :])
+    return np.clip(np.rint(lut), 0, 255).astype(np.uint8).ravel().tolist()
+
+# 통계 방식의 변환을 RGB 3x4 행렬로 합침
+# YCbCr 채널별 1차 변환(y' = a*y + b)이므로 RGB -> YCbCr -> 변환 -> RGB 전체가 하나의 RGB 1차 변환이 됨
+def build_color_matrix(reference, source, strength):
+    scale = np.clip(reference["std"] / source["std"], 0.5, 2.0)
+    gain = 1 + strength * (scale - 1)
+    bias = strength * (reference["mean"] - source["mean"] * scale)
+    rgb_from_ycbcr = np.linalg.inv(YCBCR_FROM_RGB)
+    matrix = rgb_from_ycbcr @ np.diag(gain) @ YCBCR_FROM_RGB
+    offset = rgb_from_ycbcr @ (gain * YCBCR_OFFSET + bias - YCBCR_OFFSET)
+    return tuple(np.hstack([matrix, offset[:, None]]).ravel())
+
+# 패널 색감을 기준 패널에 맞추기
+# 히스토그램 방식은 YCbCr로 바꿔 PIL의 LUT 적용으로, 통계 방식은 RGB 행렬 변환 한 번으로 처리
+def harmonize_panel(img, reference, strength=0.7):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    source = compute_color_reference(img, reference["method"])
+    if reference["method"] == "히스토그램":
+        lut = build_color_lut(reference, source, strength)
+        return img.convert("YCbCr").point(lut).convert("RGB")
+    return img.convert("RGB", build_color_matrix(reference, source, strength))
+
+# 작업 단위 색감 통일: 완성 순서와 관계없이 가장 앞 번호의 완성된 패널을 기준으로 이후 패널을 맞춤
+# 기준 패널이 정해지기 전에 완성된 패널은 보류했다가 기준이 정해지면 함께 돌려줍니다.
+# 패널은 0부터 번호를 매기며, 실패한 패널도 img=None으로 알려 주어야 다음 번호가 기준이 될 수 있습니다.
+# 반환값은 이제 후처리할 수 있는 (번호, 이미지) 목록입니다.
+def new_color_state():
+    return {"reference": None, "next": 0, "pending": {}, "elapsed": 0.0, "count": 0}
+
+def harmonize_with_reference(img, color_state, method, strength):
+    if img is None:
+        return None
+    img.load()  # 다운로드한 이미지의 디코딩 시간은 측정에서 제외
+    start = time.perf_counter()
+    if color_state["reference"] is None:
+        color_state["reference"] = compute_color_reference(img, method)
+    else:
+        img = harmonize_panel(img, color_state["reference"], strength)
+    color_state["elapsed"] += time.perf_counter() - start
+    color_state["count"] += 1
+    return img
+
+def harmonize_in_order(color_state, i, img, method, strength):
+    if color_state["reference"] is not None:
+        return [(i, harmonize_with_reference(img, color_state, method, strength))]
+    pending = color_state["pending"]
+    pending[i] = img
+    ready = []
+    while color_state["reference"] is None and color_state["next"] in pending:
+        k = color_state["next"]
+        color_state["next"] += 1
+        ready.append((k, harmonize_with_reference(pending.pop(k), color_state, method, strength)))
+    if color_state["reference"] is not None:
+        ready += [(k, harmonize_with_reference(pending.pop(k), color_state, method, strength)) for k in sorted(pending)]
+    return ready
+
+# 말풍선 자동 배치 설정
+BUBBLE_ENERGY_SCALE = 4  # 에지 에너지 계산 시 축소 배율
+BUBBLE_TOP_BIAS = 0.15  # 같은 조건이면 위쪽을 선호 (읽는 순서)
+
+# 에지 에너지 맵의 누적합 테이블(summed-area table)
+def compute_energy_table(image):
+    gray = np.asarray(image.convert("L").reduce(BUBBLE_ENERGY_SCALE), dtype=np.float32)
+    energy = np.zeros_like(gray)
+    energy[:, 1:] += np.abs(np.diff(gray, axis=1))
+    energy[1:, :] += np.abs(np.diff(gray, axis=0))
+    table = np.zeros((energy.shape[0] + 1, energy.shape[1] + 1), dtype=np.float64)
+    table[1:, 1:] = energy.cumsum(axis=0).cumsum(axis=1)
+    return table
+
+# 모든 (h, w) 크기 사각형의 에너지 합을 한 번에 계산 (결과[y, x] = 좌상단 (x, y) 사각형의 합)
+def window_sums(table, h, w):
+    return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+# 말풍선 위치 선택: 디테일이 가장 적은 영역에 배치하고, 꼬리는 가장 복잡한 영역(인물 등)을 향하게 함
+# 반환: (말풍선 x, y, 초점 x, y) - 원본 이미지 좌표
+def find_bubble_position(image, bubble_width, bubble_height, margin=20):
+    scale = BUBBLE_ENERGY_SCALE
+    table = compute_energy_table(image)
+    grid_h, grid_w = table.shape[0] - 1, table.shape[1] - 1
+    pad = max(1, margin // scale)
+    # 말풍선이 여백 안쪽보다 크면 (아주 긴 대사) 여백 안쪽 크기로 보고 후보를 찾음
+    box_w = max(1, min(grid_w - 2 * pad, int(np.ceil(bubble_width / scale))))
+    box_h = max(1, min(grid_h - 2 * pad, int(np.ceil(bubble_height / scale))))
+    
+    # 초점 영역: 이미지 1/4 크기 창 중 에너지가 가장 큰 곳의 중심
+    focus_w, focus_h = max(1, grid_w // 4), max(1, grid_h // 4)
+    focus_sums = window_sums(table, focus_h, focus_w)
+    fy, fx = np.unravel_index(np.argmax(focus_sums), focus_sums.shape)
+    focal = ((fx + focus_w / 2) * scale, (fy + focus_h / 2) * scale)
+    
+    sums = window_sums(table, box_h, box_w)
+    # 가장자리 여백 안쪽 후보만 사용
+    sums = sums[pad:max(pad + 1, sums.shape[0] - pad), pad:max(pad + 1, sums.shape[1] - pad)]
+    if sums.size == 0:
+        # 이미지가 너무 작아 후보가 없으면 상단 중앙
+        return int(max(0, (image.width - bubble_width) // 2)), int(min(margin, max(0, image.height - bubble_height))), focal[0], focal[1]
+    mean_energy = sums / (box_w * box_h)
+    ys = (np.arange(sums.shape[0]) + pad)[:, None]
+    xs = (np.arange(sums.shape[1]) + pad)[None, :]
+    score = mean_energy / (mean_energy.mean() + 1e-6) + BUBBLE_TOP_BIAS * ys / max(1, grid_h)
+    # 초점을 가리는 후보 제외
+    covers_focus = ((xs * scale <= focal[0]) & (focal[0] <= (xs + box_w) * scale)
+                    & (ys * scale <= focal[1]) & (focal[1] <= (ys + box_h) * scale))
+    score = np.where(covers_focus, np.inf, score)
+    if np.isinf(score).all():
+        score = mean_energy
+    by, bx = np.unravel_index(np.argmin(score), score.shape)
+    
+    x = min(int((bx + pad) * scale), max(0, image.width - bubble_width))
+    y = min(int((by + pad) * scale), max(0, image.height - bubble_height))
+    return x, y, focal[0], focal[1]
+
+# 말풍선 꼬리: 타원 가장자리에서 초점 방향으로 뻗는 삼각형
+def bubble_tail_points(bubble_x, bubble_y, bubble_width, bubble_height, focal_x, focal_y, length=30, half_base=12):
+    cx, cy = bubble_x + bubble_width / 2, bubble_y + bubble_height / 2
+    angle = np.arctan2(focal_y - cy, focal_x - cx)
+    dx, dy = np.cos(angle), np.sin(angle)
+    # 타원 경계에서 살짝 안쪽을 밑변 중심으로 사용
+    edge_x = cx + (bubble_width / 2 - 4) * dx
+    edge_y = cy + (bubble_height / 2 - 4) * dy
+    return [
+        (edge_x - half_base * dy, edge_y + half_base * dx),
+        (edge_x + length * dx, edge_y + length * dy),
+        (edge_x + half_base * dy, edge_y - half_base * dx),
+    ]
+
 # 이미지에 말풍선과 텍스트 추가
-def add_speech_bubble(image, text, bubble_type="기본 방울형"):
+# placement: "자동" (빈 공간 자동 배치) 또는 "상단 중앙"
+def add_speech_bubble(image, text, bubble_type="기본 방울형", placement="자동"):
     img = image.copy()
     width, height = img.size
     draw = ImageDraw.Draw(img)
@@ -359,12 +1904,21 @@ def add_speech_bubble(image, text, bubble_type="기본 방울형"):
     wrapped_text = wrap_text(text)
     textwidth, textheight = max([draw.textlength(line, font=font) for line in wrapped_text]), len(wrapped_text) * font.size + 10
     
-    # 말풍선 위치 결정 (이미지 상단에 배치)
+    # 말풍선 위치 결정
     margin = 20
-    bubble_x = (width - textwidth) // 2 - margin
-    bubble_y = margin
     bubble_width = textwidth + margin * 2
     bubble_height = textheight + margin * 2
+    tail_points = None
+    if placement == "자동":
+        # 꼬리 길이만큼 여유를 두고 가장 단순한 영역에 배치
+        bubble_x, bubble_y, focal_x, focal_y = find_bubble_position(img, bubble_width + 30, bubble_height + 30, margin)
+        bubble_x += 15
+        bubble_y += 15
+        tail_points = bubble_tail_points(bubble_x, bubble_y, bubble_width, bubble_height, focal_x, focal_y)
+    else:
+        # 이미지 상단 중앙에 배치
+        bubble_x = (width - textwidth) // 2 - margin
+        bubble_y = margin
     
     # 말풍선 그리기
     if bubble_type == "구름형":
@@ -388,13 +1942,16 @@ def add_speech_bubble(image, text, bubble_type="기본 방울형"):
         # 기본 말풍선 (대화)
         draw.ellipse([bubble_x, bubble_y, bubble_x + bubble_width, bubble_y + bubble_height], 
                     fill='white', outline='black', width=2)
-        # 꼬리 추가
-        tip_points = [
+        # 꼬리 추가 (자동 배치 시 초점 방향)
+        tip_points = tail_points or [
             (bubble_x + bubble_width//2 - 15, bubble_y + bubble_height),
             (bubble_x + bubble_width//2, bubble_y + bubble_height + 15),
             (bubble_x + bubble_width//2 + 15, bubble_y + bubble_height)
         ]
         draw.polygon(tip_points, fill='white', outline='black', width=2)
+        if tail_points:
+            # 꼬리 밑변이 말풍선 테두리를 가리지 않도록 안쪽을 다시 칠함
+            draw.ellipse([bubble_x + 3, bubble_y + 3, bubble_x + bubble_width - 3, bubble_y + bubble_height - 3], fill='white')
     
     # 텍스트 그리기
     text_x = bubble_x + margin
@@ -489,145 +2046,439 @@ def create_layout_image(images, layout_type):
     
     return combined
 
-# 탭 설정: 웹툰 생성 / 설정
-tab1, tab2 = st.tabs(["웹툰 생성", "스타일 가이드"])
+# 스타일 가이드에 따른 스타일 설명
+STYLE_GUIDES = {
+    "지브리 스튜디오 - 하울의 움직이는 성 스타일": "파스텔 색조, 섬세한 배경 디테일, 부드러운 선, 자연과 마법이 어우러진 세계",
+    "지브리 스튜디오 - 센과 치히로의 행방불명 스타일": "환상적인 요소들, 풍부한 색상 팔레트, 동양적 미학, 복잡한 배경",
+    "지브리 스튜디오 - 토토로 스타일": "귀여운 캐릭터 디자인, 자연과 시골 풍경, 따뜻한 색감, 표현력 있는 캐릭터",
+    "지브리 스튜디오 - 모노노케 히메 스타일": "자연과 영적인 요소, 진한 색감, 다이내믹한 액션 장면, 복잡한 배경",
+    "디즈니 클래식 애니메이션 스타일": "부드러운 라인, 둥근 캐릭터 디자인, 풍부한 색상, 주인공에게 집중된 조명",
+    "디즈니 3D 애니메이션 스타일": "반짝이는 텍스처, 풍부한 색감, 영화적인 구도, 표현력 있는 캐릭터, 3D 렌더링",
+    "픽사 3D 애니메이션 스타일": "세밀한 텍스처, 정확한 라이팅, 감성적인 표현, 스타일화된 캐릭터",
+    "한국식 웹툰 스타일 (LINE 웹툰)": "깔끔한 선화, 플랫한 색상, 강한 윤곽선, 감정 표현을 위한 텍스트 효과, 세로 스크롤 포맷",
+    "일본 망가 - 소년 만화 스타일": "날카로운 선, 다이내믹한 액션 라인, 과장된 표정, 속도감 있는 효과선",
+    "일본 망가 - 소녀 만화 스타일": "섬세한 선, 반짝이는 눈, 꽃 패턴 배경, 감정 표현이 풍부한 얼굴",
+    "미국 마블 코믹스 스타일": "근육질의 캐릭터, 강한 윤곽선, 선명한 색상, 다이내믹한 포즈, 극적인 구도",
+    "미국 DC 코믹스 스타일": "어두운 톤, 강한 명암 대비, 도시 배경, 영웅적인 포즈, 사실적인 인체 비율"
+}
 
-with tab1:
-    # 중요: 스타일 선택 부분을 폼 바깥으로 이동하여 즉시 반응하도록 함
+# 선택된 스타일에 대한 추가 설명 가져오기
+def get_style_description(final_style, style_guide):
+    if style_guide != "없음" and final_style in STYLE_GUIDES:
+        return f", {STYLE_GUIDES[final_style]}"
+    return ""
+
+# 세로 스크롤 웹툰 분할 설정 (플랫폼 업로드 규격)
+STRIP_WIDTH = 1024
+STRIP_PANEL_HEIGHT = 768
+STRIP_GUTTER = 20
+STRIP_MAX_SLICE_HEIGHT = 1280
+STRIP_MAX_SLICE_BYTES = 2 * 1024 * 1024
+STRIP_MIN_QUALITY = 50  # 용량 제한을 맞추려고 JPEG 품질을 낮출 수 있는 하한
+STRIP_MIN_SLICE_HEIGHT = 64  # 용량 제한을 맞추려고 조각을 나눌 수 있는 최소 높이
+
+# 세로 스크롤 웹툰을 조각 단위로 합성하는 함수 (스트리밍)
+def stream_vertical_strip(panels, width=STRIP_WIDTH, panel_height=STRIP_PANEL_HEIGHT,
+                          gutter=STRIP_GUTTER, max_slice_height=STRIP_MAX_SLICE_HEIGHT,
+                          max_slice_bytes=STRIP_MAX_SLICE_BYTES, image_format="JPEG", quality=90, stats=None):
+    """패널을 위에서 아래로 이어 붙이며 플랫폼 규격 크기의 조각을 인코딩해 하나씩 내보냅니다.
+
+    전체 세로 캔버스를 만들지 않고 조각 캔버스 하나와 현재 패널 하나만 메모리에 유지하므로
+    패널 수가 많아도 최대 메모리 사용량이 일정합니다. panels는 리스트뿐 아니라 이미지를
+    하나씩 읽어 오는 제너레이터여도 됩니다.
+
+    조각이 max_slice_bytes를 넘으면 JPEG 품질을 STRIP_MIN_QUALITY까지 낮추고, 그래도 크면
+    (또는 JPEG가 아니면) 높이를 반으로 나눠 다시 인코딩합니다. 최소 높이까지 나눠도 넘는 조각은
+    그대로 내보내고 stats["oversized"]에 개수를 더합니다.
+    """
+    slice_canvas = Image.new('RGB', (width, max_slice_height), color='white')
+    filled = 0
+
+    def encode(piece, current_quality):
+        buf = BytesIO()
+        if image_format == "JPEG":
+            piece.save(buf, format="JPEG", quality=current_quality, optimize=True)
+        else:
+            piece.save(buf, format=image_format, optimize=True)
+        return buf.getvalue()
+
+    def encode_slice(canvas, height):
+        piece = canvas if canvas.height == height else canvas.crop((0, 0, width, height))
+        # 용량 제한을 넘으면 JPEG 품질을 낮춰 다시 인코딩
+        current_quality = quality
+        data = encode(piece, current_quality)
+        while image_format == "JPEG" and len(data) > max_slice_bytes and current_quality > STRIP_MIN_QUALITY:
+            current_quality = max(STRIP_MIN_QUALITY, current_quality - 10)
+            data = encode(piece, current_quality)
+        if len(data) <= max_slice_bytes:
+            return [data]
+        if height < 2 * STRIP_MIN_SLICE_HEIGHT:
+            if stats is not None:
+                stats["oversized"] = stats.get("oversized", 0) + 1
+            return [data]
+        # 그래도 크면 위아래 두 조각으로 나눔
+        half = height // 2
+        return (encode_slice(piece.crop((0, 0, width, half)), half)
+                + encode_slice(piece.crop((0, half, width, height)), height - half))
+
+    first_panel = True
+    for panel in panels:
+        # 패널 사이 여백 (첫 패널 앞에는 넣지 않음)
+        remaining_gutter = 0 if first_panel else gutter
+        first_panel = False
+        while remaining_gutter > 0:
+            step = min(remaining_gutter, max_slice_height - filled)
+            filled += step  # 캔버스가 흰색이므로 위치만 이동
+            remaining_gutter -= step
+            if filled == max_slice_height:
+                yield from encode_slice(slice_canvas, filled)
+                slice_canvas = Image.new('RGB', (width, max_slice_height), color='white')
+                filled = 0
+
+        resized = panel.convert('RGB').resize((width, panel_height))
+        src_y = 0
+        while src_y < panel_height:
+            step = min(panel_height - src_y, max_slice_height - filled)
+            slice_canvas.paste(resized.crop((0, src_y, width, src_y + step)), (0, filled))
+            src_y += step
+            filled += step
+            if filled == max_slice_height:
+                yield from encode_slice(slice_canvas, filled)
+                slice_canvas = Image.new('RGB', (width, max_slice_height), color='white')
+                filled = 0
+        del resized
+
+    # 마지막 남은 조각
+    if filled > 0:
+        yield from encode_slice(slice_canvas, filled)
+
+# 분할된 조각들을 하나의 ZIP 파일로 묶는 함수
+def zip_strip_slices(slices, file_prefix="my_webtoon_strip", extension="jpg"):
+    buf = BytesIO()
+    count = 0
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for i, data in enumerate(slices):
+            zf.writestr(f"{file_prefix}_{i+1:03d}.{extension}", data)
+            count += 1
+    buf.seek(0)
+    return buf, count
+
+# 세로 스크롤 업로드용 분할 조각 ZIP 다운로드 버튼 (panels는 패널을 하나씩 내보내는 제너레이터여도 됨)
+def show_strip_download(panels, label, file_prefix):
+    stats = {"oversized": 0}
+    strip_zip, slice_count = zip_strip_slices(stream_vertical_strip(panels, stats=stats), file_prefix)
+    if stats["oversized"]:
+        st.warning(f"분할 조각 {stats['oversized']}장이 업로드 용량 제한({STRIP_MAX_SLICE_BYTES // (1024 * 1024)}MB)을 넘습니다.")
+    st.download_button(
+        label=f"{label} ({slice_count}장)",
+        data=strip_zip,
+        file_name=f"{file_prefix}.zip",
+        mime="application/zip",
+        on_click="ignore"
+    )
+
+# 시리즈 모드: '---' 한 줄로 구분된 에피소드 스토리 나누기
+def split_episodes(episodes_text):
+    episodes = []
+    current = []
+    for line in episodes_text.splitlines():
+        if line.strip() == "---":
+            if "\n".join(current).strip():
+                episodes.append("\n".join(current).strip())
+            current = []
+        else:
+            current.append(line)
+    if "\n".join(current).strip():
+        episodes.append("\n".join(current).strip())
+    return episodes
+
+# 생성 기록 저장소 설정
+# 검색용 SQLite 색인은 복제본마다 history/에 두고, 패널/합성/썸네일 이미지는 산출물 저장소의
+# history/<작업 ID>/ 아래에 저장해 어느 복제본에서든 다시 받거나 재배치할 수 있게 합니다.
+HISTORY_DIR = "history"
+HISTORY_DB = os.path.join(HISTORY_DIR, "index.sqlite3")
+HISTORY_MAX_JOBS = 200
+HISTORY_MAX_BYTES = 1024 * 1024 * 1024  # 1GB
+HISTORY_PAGE_SIZE = 8
+HISTORY_THUMBNAIL_WIDTH = 320
+
+# 생성 기록 DB 연결 (Streamlit 실행 스레드가 바뀌므로 호출할 때마다 새로 연결)
+def connect_history_db():
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    conn = sqlite3.connect(HISTORY_DB)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            story TEXT,
+            style TEXT,
+            layout TEXT,
+            bubble_style TEXT,
+            character_description TEXT,
+            descriptions TEXT,
+            dialogues TEXT,
+            prompts TEXT,
+            timings TEXT,
+            panel_count INTEGER,
+            total_bytes INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+    return conn
+
+def get_history_artifact_key(job_id, name):
+    return f"{HISTORY_DIR}/{job_id}/{name}"
+
+def get_history_artifact_names(panel_count):
+    return [f"panel_{i+1}.png" for i in range(panel_count)] + ["composite.png", "thumb.jpg"]
+
+# 기록 이미지 읽기 (없거나 저장소에 연결할 수 없으면 None)
+def read_history_artifact(job_id, name):
+    try:
+        return artifact_store.get(get_history_artifact_key(job_id, name))
+    except OSError:
+        return None
+
+def encode_png(img):
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+# 생성 결과 저장 (말풍선 없는 패널 + 합성 이미지 + 썸네일)
+def save_history_job(story, style, layout, bubble_style, character_description, panels_data, prompts,
+                     raw_panels, composite, timings):
+    job_id = uuid.uuid4().hex
+    artifacts = [encode_png(panel) for panel in raw_panels]
+    artifacts += [encode_png(composite), encode_preview(composite, HISTORY_THUMBNAIL_WIDTH)]
+    for name, data in zip(get_history_artifact_names(len(raw_panels)), artifacts):
+        artifact_store.put(get_history_artifact_key(job_id, name), data)
+    total_bytes = sum(len(data) for data in artifacts)
+    
+    with closing(connect_history_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, time.time(), story, style, layout, bubble_style, character_description,
+             json.dumps([panel.get("description", "") for panel in panels_data], ensure_ascii=False),
+             json.dumps([panel.get("dialogue", "") for panel in panels_data], ensure_ascii=False),
+             json.dumps(prompts, ensure_ascii=False),
+             json.dumps(timings), len(raw_panels), total_bytes)
+        )
+    prune_history()
+    return job_id
+
+def delete_history_artifacts(job_id, panel_count):
+    for name in get_history_artifact_names(panel_count):
+        artifact_store.delete(get_history_artifact_key(job_id, name))
+
+# 보관 개수와 용량 제한을 넘으면 오래된 기록부터 삭제
+def prune_history(max_jobs=HISTORY_MAX_JOBS, max_bytes=HISTORY_MAX_BYTES):
+    with closing(connect_history_db()) as conn, conn:
+        rows = conn.execute("SELECT id, total_bytes, panel_count FROM jobs ORDER BY created_at DESC").fetchall()
+        kept_bytes = 0
+        expired = []
+        for index, row in enumerate(rows):
+            kept_bytes += row["total_bytes"] or 0
+            if index >= max_jobs or kept_bytes > max_bytes:
+                expired.append(row)
+        for row in expired:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+            delete_history_artifacts(row["id"], row["panel_count"])
+    return len(expired)
+
+def count_history_jobs():
+    with closing(connect_history_db()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+def list_history_jobs(offset, limit):
+    with closing(connect_history_db()) as conn:
+        return conn.execute(
+            "SELECT id, created_at, story, style, layout, panel_count FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+
+def get_history_job(job_id):
+    with closing(connect_history_db()) as conn:
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+# 말풍선 없는 패널 불러오기 (하나라도 없으면 None)
+def load_history_panels(job_id, panel_count):
+    panels = []
+    for i in range(panel_count):
+        data = read_history_artifact(job_id, f"panel_{i+1}.png")
+        if data is None:
+            return None
+        with Image.open(BytesIO(data)) as panel:
+            panels.append(panel.convert("RGB"))
+    return panels
+
+# 갤러리 썸네일 (현재 페이지에 보이는 기록만 읽음, 작업 ID별 썸네일은 바뀌지 않음)
+@st.cache_data(max_entries=128, show_spinner=False)
+def get_history_thumbnail(job_id):
+    return read_history_artifact(job_id, "thumb.jpg")
+
+def delete_history_job(job_id):
+    job = get_history_job(job_id)
+    with closing(connect_history_db()) as conn, conn:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    if job:
+        delete_history_artifacts(job_id, job["panel_count"])
+
+# 스타일 카테고리별 세부 스타일 (고정 목록이므로 실행마다 새로 만들지 않음)
+STYLE_OPTIONS = {
+    "애니메이션/만화 스타일": [
+        "지브리 스튜디오 - 하울의 움직이는 성 스타일",
+        "지브리 스튜디오 - 센과 치히로의 행방불명 스타일",
+        "지브리 스튜디오 - 토토로 스타일",
+        "지브리 스튜디오 - 모노노케 히메 스타일",
+        "디즈니 클래식 애니메이션 스타일",
+        "디즈니 3D 애니메이션 스타일",
+        "픽사 3D 애니메이션 스타일",
+        "한국식 웹툰 스타일 (LINE 웹툰)",
+        "일본 망가 - 소년 만화 스타일",
+        "일본 망가 - 소녀 만화 스타일",
+        "미국 마블 코믹스 스타일",
+        "미국 DC 코믹스 스타일",
+        "심슨 가족 스타일",
+        "파워퍼프걸 스타일",
+        "어드벤처 타임 스타일",
+        "아바타: 마지막 에어벤더 스타일"
+    ],
+    "예술 스타일": [
+        "수채화 스타일",
+        "유화 스타일",
+        "인상주의 스타일",
+        "팝아트 스타일",
+        "미니멀리즘 스타일",
+        "초현실주의 스타일",
+        "아르누보 스타일",
+        "수묵화 스타일",
+        "고흐 스타일",
+        "피카소 스타일",
+        "모네 스타일",
+        "앤디 워홀 스타일"
+    ],
+    "게임/디지털 스타일": [
+        "픽셀 아트 스타일",
+        "로블록스 스타일",
+        "마인크래프트 스타일",
+        "포트나이트 스타일",
+        "사이버펑크 스타일",
+        "베이퍼웨이브 스타일",
+        "로우 폴리 3D 스타일",
+        "레트로 게임 스타일",
+        "젤다의 전설: 눈물의 왕국 스타일"
+    ],
+    "기타 스타일": [
+        "클레이 애니메이션 스타일",
+        "스톱모션 스타일",
+        "빈티지 포스터 스타일",
+        "네온 사인 스타일",
+        "스케치북 스타일",
+        "스티커 아트 스타일",
+        "콜라주 스타일",
+        "신문 만화 스타일",
+        "실루엣 스타일",
+        "파스텔 색상 스타일"
+    ]
+}
+
+LAYOUT_LABELS = {
+    "A": "2x2 그리드 (기본)",
+    "B": "세로형",
+    "C": "상단 1컷 + 하단 2컷",
+    "D": "좌측 세로 + 우측 2컷"
+}
+
+LAYOUT_DESCRIPTIONS = {
+    "A": "2x2 그리드 레이아웃: 4개의 패널이 정사각형으로 배치됩니다.",
+    "B": "세로형 레이아웃: 4개의 패널이 세로로 길게 배치됩니다.",
+    "C": "상단 1컷 + 하단 2컷 레이아웃: 상단에 큰 패널 1개, 하단에 작은 패널 2개가 배치됩니다.",
+    "D": "좌측 세로 + 우측 2컷 레이아웃: 좌측에 세로로 긴 패널 1개, 우측에 작은 패널 2개가 배치됩니다."
+}
+
+# 부분 재실행 (st.fragment)
+# 스타일/레이아웃 선택과 생성 기록 보기는 조작해도 앱 전체가 아니라 해당 부분만 다시 실행됩니다.
+# 선택 값은 위젯 key로 session_state에 두고, 전체 실행(생성하기 제출 등) 때 읽습니다.
+# 프로파일링 모드에서는 부분 재실행마다 서버 시간을 기록해 전체 실행 시간과 비교합니다.
+INTERACTION_HISTORY_SIZE = 50
+
+def record_interaction(scope, elapsed):
+    timings = st.session_state.setdefault("interaction_timings", [])
+    timings.append({"범위": scope, "서버 시간 (ms)": round(elapsed * 1000, 1)})
+    del timings[:-INTERACTION_HISTORY_SIZE]
+
+def timed_fragment(scope):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def run_fragment(*args, **kwargs):
+            # 전체 실행의 일부로 실행될 때는 전체 실행 시간에 포함되므로 따로 기록하지 않음
+            if not profiling_enabled or not get_script_run_ctx().fragment_ids_this_run:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_interaction(scope, time.perf_counter() - start)
+        return st.fragment(run_fragment)
+    return decorator
+
+# 최종 스타일 (직접 입력이 있으면 우선)
+def get_final_style():
+    return st.session_state.get("custom_style") or st.session_state.get("selected_style") \
+        or STYLE_OPTIONS[next(iter(STYLE_OPTIONS))][0]
+
+@timed_fragment("스타일 선택")
+def style_picker():
     st.subheader("웹툰 스타일 선택")
     style_col1, style_col2 = st.columns(2)
     
     with style_col1:
-        style_category = st.selectbox("스타일 카테고리", [
-            "애니메이션/만화 스타일", 
-            "예술 스타일", 
-            "게임/디지털 스타일",
-            "기타 스타일"
-        ])
+        style_category = st.selectbox("스타일 카테고리", list(STYLE_OPTIONS), key="style_category")
     
     with style_col2:
         # 카테고리별 세부 스타일 옵션
-        if style_category == "애니메이션/만화 스타일":
-            style_options = [
-                "지브리 스튜디오 - 하울의 움직이는 성 스타일",
-                "지브리 스튜디오 - 센과 치히로의 행방불명 스타일",
-                "지브리 스튜디오 - 토토로 스타일",
-                "지브리 스튜디오 - 모노노케 히메 스타일",
-                "디즈니 클래식 애니메이션 스타일",
-                "디즈니 3D 애니메이션 스타일",
-                "픽사 3D 애니메이션 스타일",
-                "한국식 웹툰 스타일 (LINE 웹툰)",
-                "일본 망가 - 소년 만화 스타일",
-                "일본 망가 - 소녀 만화 스타일",
-                "미국 마블 코믹스 스타일",
-                "미국 DC 코믹스 스타일",
-                "심슨 가족 스타일",
-                "파워퍼프걸 스타일",
-                "어드벤처 타임 스타일",
-                "아바타: 마지막 에어벤더 스타일"
-            ]
-        elif style_category == "예술 스타일":
-            style_options = [
-                "수채화 스타일",
-                "유화 스타일",
-                "인상주의 스타일",
-                "팝아트 스타일",
-                "미니멀리즘 스타일",
-                "초현실주의 스타일",
-                "아르누보 스타일",
-                "수묵화 스타일",
-                "고흐 스타일",
-                "피카소 스타일",
-                "모네 스타일",
-                "앤디 워홀 스타일"
-            ]
-        elif style_category == "게임/디지털 스타일":
-            style_options = [
-                "픽셀 아트 스타일",
-                "로블록스 스타일",
-                "마인크래프트 스타일",
-                "포트나이트 스타일",
-                "사이버펑크 스타일",
-                "베이퍼웨이브 스타일",
-                "로우 폴리 3D 스타일",
-                "레트로 게임 스타일",
-                "젤다의 전설: 눈물의 왕국 스타일"
-            ]
-        else:  # 기타 스타일
-            style_options = [
-                "클레이 애니메이션 스타일",
-                "스톱모션 스타일",
-                "빈티지 포스터 스타일",
-                "네온 사인 스타일",
-                "스케치북 스타일",
-                "스티커 아트 스타일",
-                "콜라주 스타일",
-                "신문 만화 스타일",
-                "실루엣 스타일",
-                "파스텔 색상 스타일"
-            ]
-        
-        selected_style = st.selectbox("세부 스타일", style_options)
-        
-    # 사용자 정의 스타일 입력    
-    custom_style = st.text_input("직접 스타일 입력 (선택사항)", 
-                                placeholder="원하는 스타일이 위 목록에 없다면 직접 입력하세요")
-        
-    # 최종 스타일 표시
-    final_style = custom_style if custom_style else selected_style
-    st.info(f"선택된 스타일: {final_style}")
+        st.selectbox("세부 스타일", STYLE_OPTIONS[style_category], key="selected_style")
     
-    # 레이아웃 선택 UI (이미지 버튼)
+    # 사용자 정의 스타일 입력
+    st.text_input("직접 스타일 입력 (선택사항)",
+                  placeholder="원하는 스타일이 위 목록에 없다면 직접 입력하세요", key="custom_style")
+    
+    # 최종 스타일 표시
+    st.info(f"선택된 스타일: {get_final_style()}")
+
+def select_layout(layout_type):
+    st.session_state.selected_layout = layout_type
+
+@timed_fragment("레이아웃 선택")
+def layout_picker():
     st.subheader("웹툰 레이아웃 선택")
     st.markdown("원하는 4컷 레이아웃을 선택하세요.")
     
-    # 레이아웃 이미지 옵션 표시
-    col1, col2, col3, col4 = st.columns(4)
-    
     # 각 레이아웃 이미지 표시 및 선택 버튼
-    layouts = {
-        "A": "2x2 그리드 (기본)",
-        "B": "세로형",
-        "C": "상단 1컷 + 하단 2컷",
-        "D": "좌측 세로 + 우측 2컷"
-    }
-    
-    # 세션 상태 초기화
-    if 'selected_layout' not in st.session_state:
-        st.session_state.selected_layout = "A"
-    
-    with col1:
-        st.image("images/A_Frame.png", caption=layouts["A"], width=150)
-        if st.button("A 레이아웃"):
-            st.session_state.selected_layout = "A"
-    
-    with col2:
-        st.image("images/B_Frame.png", caption=layouts["B"], width=150)
-        if st.button("B 레이아웃"):
-            st.session_state.selected_layout = "B"
-    
-    with col3:
-        st.image("images/C_Frame.png", caption=layouts["C"], width=150)
-        if st.button("C 레이아웃"):
-            st.session_state.selected_layout = "C"
-    
-    with col4:
-        st.image("images/D_Frame.png", caption=layouts["D"], width=150)
-        if st.button("D 레이아웃"):
-            st.session_state.selected_layout = "D"
+    for layout_col, layout_type in zip(st.columns(4), LAYOUT_LABELS):
+        with layout_col:
+            show_frame_thumbnail(layout_type, caption=LAYOUT_LABELS[layout_type], width=150)
+            st.button(f"{layout_type} 레이아웃", on_click=select_layout, args=(layout_type,))
     
     # 선택된 레이아웃 표시
-    st.success(f"선택된 레이아웃: {layouts[st.session_state.selected_layout]}")
+    st.success(f"선택된 레이아웃: {LAYOUT_LABELS[st.session_state.selected_layout]}")
     
     # 레이아웃 설명 표시
-    layout_descriptions = {
-        "A": "2x2 그리드 레이아웃: 4개의 패널이 정사각형으로 배치됩니다.",
-        "B": "세로형 레이아웃: 4개의 패널이 세로로 길게 배치됩니다.",
-        "C": "상단 1컷 + 하단 2컷 레이아웃: 상단에 큰 패널 1개, 하단에 작은 패널 2개가 배치됩니다.",
-        "D": "좌측 세로 + 우측 2컷 레이아웃: 좌측에 세로로 긴 패널 1개, 우측에 작은 패널 2개가 배치됩니다."
-    }
+    st.info(LAYOUT_DESCRIPTIONS[st.session_state.selected_layout])
+
+# 탭 설정: 웹툰 생성 / 시리즈 모드 / 생성 기록 / 설정
+tab1, tab_series, tab_history, tab2 = st.tabs(["웹툰 생성", "시리즈 모드", "생성 기록", "스타일 가이드"])
+
+with tab1:
+    # 세션 상태 초기화
+    if 'selected_layout' not in st.session_state:
+        st.session_state.selected_layout = "A"
     
-    st.info(layout_descriptions[st.session_state.selected_layout])
+    # 스타일/레이아웃 선택 (조작 시 해당 부분만 다시 실행)
+    style_picker()
+    final_style = get_final_style()
+    layout_picker()
     
     # 입력 폼 구성
     with st.form("webtoon_form"):
@@ -638,10 +2489,15 @@ with tab1:
                                     placeholder="웹툰으로 만들고 싶은 스토리를 입력하세요...",
                                     height=150)
             
-            user_photo = st.file_uploader("내 사진 업로드 (필수)", type=["png", "jpg", "jpeg"])
+            user_photos = st.file_uploader("등장인물 사진 업로드 (필수, 여러 장 가능)", type=["png", "jpg", "jpeg"],
+                                           accept_multiple_files=True,
+                                           help="커플/친구 웹툰은 인물마다 한 장씩 올리세요. 첫 번째 사진이 주인공입니다")
+            cast_names_text = st.text_input("등장인물 이름 (사진 순서대로, 쉼표로 구분)", placeholder="예: 철수, 영희")
             
-            if user_photo:
-                st.image(user_photo, caption="업로드된 사진", width=200)
+            if user_photos:
+                photo_cols = st.columns(min(4, len(user_photos)))
+                for k, (photo, name) in enumerate(zip(user_photos, parse_cast_names(cast_names_text, len(user_photos)))):
+                    show_preview(photo_cols[k % len(photo_cols)], Image.open(photo), caption=name, width=150)
                 
             # 패널 수 고정 (4컷)
             st.write("**패널 수: 4컷**")
@@ -661,6 +2517,14 @@ with tab1:
                 image_quality = st.select_slider("이미지 품질", options=["standard", "hd"], value="standard")
                 image_style = st.select_slider("이미지 스타일", options=["natural", "vivid"], value="vivid")
                 
+                # 패널 색감 통일
+                st.markdown("**패널 색감 통일**")
+                harmonize_colors = st.checkbox("패널 간 색감/밝기 맞추기", value=False,
+                                               help="첫 번째 패널의 색감에 나머지 패널을 맞춥니다. API 호출 없이 로컬에서 처리됩니다")
+                harmonize_method = st.radio("색감 맞춤 방식", ["통계", "히스토그램"], horizontal=True,
+                                            help="통계: 평균/대비만 맞춤 (자연스러움), 히스토그램: 색 분포 전체를 맞춤 (강함)")
+                harmonize_strength = st.slider("색감 맞춤 강도", min_value=0.0, max_value=1.0, value=0.7, step=0.1)
+                
                 # 말풍선 스타일 선택 추가
                 st.markdown("**말풍선 스타일**")
                 bubble_style = st.select_slider("말풍선 스타일", 
@@ -668,6 +2532,9 @@ with tab1:
                                                value="기본 방울형",
                                                help="생성되는 웹툰의 말풍선 스타일을 선택합니다")
                 
+                bubble_placement = st.radio("말풍선 위치", ["자동", "상단 중앙"], horizontal=True,
+                                            help="자동: 그림에서 가장 단순한 영역에 배치하고 꼬리가 인물 쪽을 향합니다")
+                
                 # 말풍선 텍스트 크기
                 st.markdown("**말풍선 텍스트 크기**")
                 text_size = st.slider("텍스트 크기", min_value=20, max_value=50, value=30,
@@ -684,35 +2551,20 @@ with tab1:
         submit_button = st.form_submit_button("웹툰 생성하기")
 
     # 웹툰 생성 처리
+    if not submit_button:
+        show_cancelled_job_once("active_job")
     if submit_button:
-        if not api_key:
-            st.error("OpenAI API 키를 입력해주세요!")
+        if not api_key and not offline_mode:
+            st.error("OpenAI API 키를 입력해주세요! (키 없이 실행하려면 로컬 절차적 백엔드와 '이전 분석 결과 재사용'을 함께 선택하세요)")
         elif not story_text:
             st.error("웹툰 스토리를 입력해주세요!")
-        elif not user_photo:
-            st.error("내 사진을 업로드해주세요!")
+        elif not user_photos:
+            st.error("등장인물 사진을 한 장 이상 업로드해주세요!")
         else:
             try:
-                # 스타일 가이드에 따른 스타일 설명 추가
-                style_guides = {
-                    "지브리 스튜디오 - 하울의 움직이는 성 스타일": "파스텔 색조, 섬세한 배경 디테일, 부드러운 선, 자연과 마법이 어우러진 세계",
-                    "지브리 스튜디오 - 센과 치히로의 행방불명 스타일": "환상적인 요소들, 풍부한 색상 팔레트, 동양적 미학, 복잡한 배경",
-                    "지브리 스튜디오 - 토토로 스타일": "귀여운 캐릭터 디자인, 자연과 시골 풍경, 따뜻한 색감, 표현력 있는 캐릭터",
-                    "지브리 스튜디오 - 모노노케 히메 스타일": "자연과 영적인 요소, 진한 색감, 다이내믹한 액션 장면, 복잡한 배경",
-                    "디즈니 클래식 애니메이션 스타일": "부드러운 라인, 둥근 캐릭터 디자인, 풍부한 색상, 주인공에게 집중된 조명",
-                    "디즈니 3D 애니메이션 스타일": "반짝이는 텍스처, 풍부한 색감, 영화적인 구도, 표현력 있는 캐릭터, 3D 렌더링",
-                    "픽사 3D 애니메이션 스타일": "세밀한 텍스처, 정확한 라이팅, 감성적인 표현, 스타일화된 캐릭터",
-                    "한국식 웹툰 스타일 (LINE 웹툰)": "깔끔한 선화, 플랫한 색상, 강한 윤곽선, 감정 표현을 위한 텍스트 효과, 세로 스크롤 포맷",
-                    "일본 망가 - 소년 만화 스타일": "날카로운 선, 다이내믹한 액션 라인, 과장된 표정, 속도감 있는 효과선",
-                    "일본 망가 - 소녀 만화 스타일": "섬세한 선, 반짝이는 눈, 꽃 패턴 배경, 감정 표현이 풍부한 얼굴",
-                    "미국 마블 코믹스 스타일": "근육질의 캐릭터, 강한 윤곽선, 선명한 색상, 다이내믹한 포즈, 극적인 구도",
-                    "미국 DC 코믹스 스타일": "어두운 톤, 강한 명암 대비, 도시 배경, 영웅적인 포즈, 사실적인 인체 비율"
-                }
                 
                 # 선택된 스타일에 대한 추가 설명 가져오기
-                style_description = ""
-                if style_guide != "없음" and final_style in style_guides:
-                    style_description = f", {style_guides[final_style]}"
+                style_description = get_style_description(final_style, style_guide)
                 
                 # 진행 상태 컨테이너
                 status_container = st.empty()
@@ -721,11 +2573,35 @@ with tab1:
                 # 선택된 레이아웃 가져오기
                 layout_type = st.session_state.selected_layout
                 
-                with st.spinner("사진 분석 중..."):
-                    # 사진 분석
-                    status_container.info("업로드된 사진을 분석하는 중입니다...")
-                    photo_base64 = encode_image(user_photo)
-                    character_description = analyze_photo(photo_base64)
+                # 최종 스타일에 스타일 설명 추가
+                enhanced_style = final_style
+                if style_description:
+                    enhanced_style += style_description
+                
+                # 이미지 생성 백엔드 (패널 4장을 한 번에 요청)
+                image_backend = create_image_backend(image_backend_name, image_style)
+                
+                # 취소 버튼 (사진/스토리 분석, 프롬프트 생성 3회 + 패널 이미지 호출)
+                start_job_with_cancel("active_job", 2 + len(user_photos) + (num_panels if image_backend.calls_api else 0))
+                
+                # 등장인물 (이름을 지정했거나 여러 명이면 스토리/프롬프트에서 이름으로 구분)
+                cast_names = parse_cast_names(cast_names_text, len(user_photos))
+                story_cast_names = cast_names if len(user_photos) > 1 or cast_names_text.strip() else None
+                
+                with st.spinner("사진 및 스토리 분석 중..."):
+                    # 인물별 사진 분석과 스토리 장면 분석은 서로 독립적이므로 모두 동시에 실행하고,
+                    # 프롬프트 생성은 두 결과가 모두 준비되면 실행
+                    status_container.info(f"업로드된 사진 {len(user_photos)}장과 스토리를 동시에 분석하는 중입니다...")
+                    photos_base64 = [normalize_photo(photo) for photo in user_photos]
+                    pipeline_results, pipeline_trace = run_pipeline({
+                        "photo": ([], lambda: analyze_cast(photos_base64, cast_names)),
+                        "story": ([], lambda: analyze_story(story_text, None, num_panels, layout_type, story_cast_names)),
+                        "prompts": (["photo", "story"], lambda photo, story: create_prompts(
+                            normalize_panel_descriptions(story, num_panels), enhanced_style, photo, num_panels, layout_type,
+                            story_cast_names)),
+                    })
+                    character_descriptor = pipeline_results["photo"]
+                    character_description = character_descriptor.source if character_descriptor else None
                     
                     if character_description:
                         st.success("사진 분석 완료!")
@@ -737,10 +2613,9 @@ with tab1:
                         # 진행 상태 표시
                         progress_bar = st.progress(0)
                         status_text = st.empty()
-                        status_text.text("스토리 분석 중...")
                         
-                        # 스토리 분석
-                        panel_descriptions = analyze_story(story_text, character_description, num_panels, layout_type)
+                        # 스토리 분석 결과
+                        panel_descriptions = pipeline_results["story"]
                         progress_bar.progress(0.2)
                         
                         if panel_descriptions:
@@ -752,17 +2627,7 @@ with tab1:
                                 
                                 # 각 패널의 대화 수정 입력 폼
                                 panel_dialogues = {}
-                                panel_descriptions_data = panel_descriptions["panels"]
-                                
-                                # 패널이 부족한 경우 더미 데이터 추가
-                                while len(panel_descriptions_data) < num_panels:
-                                    panel_descriptions_data.append({
-                                        "description": f"패널 {len(panel_descriptions_data) + 1}",
-                                        "dialogue": "안녕하세요!"  # 기본 한국어 대사 추가
-                                    })
-                                
-                                # 패널 수에 맞게 조정
-                                panel_descriptions_data = panel_descriptions_data[:num_panels]
+                                panel_descriptions_data = normalize_panel_descriptions(panel_descriptions, num_panels)
                                 
                                 # 패널별 대화 수정 입력 받기
                                 for i, panel in enumerate(panel_descriptions_data):
@@ -788,15 +2653,8 @@ with tab1:
                                         if i in panel_dialogues:
                                             panel["dialogue"] = panel_dialogues[i]
                                 
-                                status_text.text("프롬프트 생성 중...")
-                                
-                                # 최종 스타일에 스타일 설명 추가
-                                enhanced_style = final_style
-                                if style_description:
-                                    enhanced_style += style_description
-                                
-                                # DALL-E 프롬프트 생성 (말풍선 없이)
-                                prompts = create_prompts(panel_descriptions_data, enhanced_style, character_description, num_panels, layout_type)
+                                # DALL-E 프롬프트 생성 결과 (말풍선 없이)
+                                prompts = pipeline_results["prompts"]
                                 progress_bar.progress(0.4)
                                 
                                 if prompts:
@@ -807,50 +2665,60 @@ with tab1:
                                         image_containers.append(st.empty())
                                     
                                     # 각 패널 이미지 생성
-                                    panel_images = []
-                                    panel_urls = []  # 이미지 URL 저장
-                                    panel_errors = 0
+                                    images_start = time.perf_counter()
+                                    images_offset = max(stage["end"] for stage in pipeline_trace.values())
+                                    color_state = new_color_state()
+                                    panel_prompts = prompts["prompts"][:num_panels]
+                                    bubbled_slots = [None] * len(panel_prompts)
+                                    raw_slots = [None] * len(panel_prompts)  # 생성 기록 저장용 (말풍선 없음)
                                     
-                                    for i, prompt in enumerate(prompts["prompts"][:num_panels]):
-                                        status_text.text(f"{i+1}번 패널 생성 중... ({i+1}/{num_panels})")
-                                        
-                                        # 이미지 생성 (캐릭터 특징 강조)
-                                        simplified_description = " ".join(character_description.split(" ")[:20])  # 간략화
-                                        
-                                        # 스타일 설명 추가
-                                        enhanced_prompt = prompt
-                                        if style_description:
-                                            enhanced_prompt += style_description
-                                        
-                                        # 대화 내용
-                                        dialogue = panel_descriptions_data[i].get("dialogue", "")
-                                        
-                                        # 이미지 생성 시도 (최대 2회)
-                                        for attempt in range(2):
-                                            # 말풍선 없는 이미지 생성
-                                            image_url = generate_image(enhanced_prompt, enhanced_style, simplified_description)
+                                    # 패널이 완성되는 순서대로 후처리 후 표시
+                                    # (색감 통일을 켜면 1번 패널이 기준이므로, 그보다 먼저 완성된 패널은 1번 패널이 나올 때까지 보류)
+                                    def on_panel_done(i, img):
+                                        if harmonize_colors:
+                                            for k, ready in harmonize_in_order(color_state, i, img, harmonize_method, harmonize_strength):
+                                                finish_panel(k, ready)
+                                        else:
+                                            finish_panel(i, img)
+                                    
+                                    def finish_panel(i, img):
+                                        if img:
+                                            raw_slots[i] = img
                                             
-                                            if image_url:
-                                                panel_urls.append(image_url)  # URL 저장
-                                                
-                                                img = get_image_from_url(image_url)
-                                                if img:
-                                                    # 이미지에 말풍선과 텍스트 추가
-                                                    img_with_bubble = add_speech_bubble(img, dialogue, bubble_style)
-                                                    panel_images.append(img_with_bubble)
-                                                    image_containers[i].image(img_with_bubble, caption=f"{i+1}번 패널", use_container_width=True)
-                                                break
-                                            elif attempt < 1:
-                                                # 첫 번째 시도 실패시 프롬프트 단순화하여 재시도
-                                                st.warning(f"{i+1}번 패널 생성 중 오류 발생. 프롬프트를 단순화하여 다시 시도합니다...")
-                                                simplified_prompt = f"단일 웹툰 패널, {final_style}, 말풍선이나 텍스트 없음"
-                                                enhanced_prompt = simplified_prompt
-                                            else:
-                                                panel_errors += 1
-                                                st.error(f"{i+1}번 패널 생성에 실패했습니다.")
+                                            # 이미지에 말풍선과 텍스트 추가
+                                            dialogue = panel_descriptions_data[i].get("dialogue", "")
+                                            bubbled_slots[i] = add_speech_bubble(img, dialogue, bubble_style, bubble_placement)
+                                            job_token.finished_panels.append((f"{i+1}번 패널", bubbled_slots[i]))
+                                            show_preview(image_containers[i], bubbled_slots[i], caption=f"{i+1}번 패널")
+                                        else:
+                                            st.error(f"{i+1}번 패널 생성에 실패했습니다.")
                                         
                                         # 진행률 업데이트
-                                        progress_bar.progress(0.4 + (i + 1) * (0.6 / num_panels))
+                                        finished = sum(1 for slot in bubbled_slots if slot is not None)
+                                        status_text.text(f"패널 생성 중... ({finished}/{num_panels})")
+                                        progress_bar.progress(0.4 + finished * (0.6 / num_panels))
+                                    
+                                    status_text.text(f"{num_panels}개 패널 생성 중... ({image_backend.name})")
+                                    generate_panel_images(panel_prompts, enhanced_style, final_style, character_descriptor,
+                                                          image_backend, style_description, quality=image_quality,
+                                                          on_result=on_panel_done)
+                                    
+                                    finished_indices = [i for i, img in enumerate(bubbled_slots) if img is not None]
+                                    panel_images = [bubbled_slots[i] for i in finished_indices]
+                                    raw_panels = [raw_slots[i] for i in finished_indices]
+                                    saved_panels_data = [panel_descriptions_data[i] for i in finished_indices]
+                                    saved_prompts = [panel_prompts[i] for i in finished_indices]
+                                    panel_errors = len(panel_prompts) - len(panel_images)
+                                    
+                                    add_trace_stage(pipeline_trace, "images", ["prompts"], images_offset,
+                                                    images_offset + time.perf_counter() - images_start,
+                                                    "완료" if panel_images else "실패")
+                                    show_pipeline_trace(pipeline_trace, PIPELINE_STAGE_LABELS)
+                                    if chat_cache_stats["hits"]:
+                                        st.caption(f"분석 결과 재사용: {chat_cache_stats['hits']}회 (새 분석 호출 {chat_cache_stats['misses']}회)")
+                                    show_prompt_token_report(character_descriptor)
+                                    if harmonize_colors and color_state["count"]:
+                                        st.caption(f"패널 색감 통일: {color_state['count']}개 패널, {color_state['elapsed'] * 1000:.1f} ms")
                                     
                                     if len(panel_images) > 0:
                                         if len(panel_images) == num_panels:
@@ -862,7 +2730,7 @@ with tab1:
                                         elif panel_errors > 0:
                                             st.warning(f"{panel_errors}개 패널 생성에 실패했습니다. 성공적으로 생성된 패널만 표시합니다.")
                                         
-                                        # 이미지 다운로드 버튼
+                                        # 이미지 다운로드 버튼 (다운로드해도 다시 실행하지 않아 결과 화면이 유지됨)
                                         st.markdown("### 개별 패널 다운로드")
                                         for i, img in enumerate(panel_images):
                                             col1, col2 = st.columns([3, 1])
@@ -878,7 +2746,8 @@ with tab1:
                                                     label=f"다운로드",
                                                     data=buf,
                                                     file_name=f"my_webtoon_panel_{i+1}.png",
-                                                    mime="image/png"
+                                                    mime="image/png",
+                                                    on_click="ignore"
                                                 )
                                         
                                         # 선택된 레이아웃에 따라 이미지 합성
@@ -907,11 +2776,28 @@ with tab1:
                                                 label=f"{layout_description[layout_type]} 웹툰 다운로드",
                                                 data=buf,
                                                 file_name=f"my_webtoon_layout_{layout_type}.png",
-                                                mime="image/png"
+                                                mime="image/png",
+                                                on_click="ignore"
                                             )
                                             
                                             # 합친 이미지 표시
-                                            st.image(combined_img, caption=f"{layout_description[layout_type]} 웹툰", use_container_width=True)
+                                            show_preview(st, combined_img, caption=f"{layout_description[layout_type]} 웹툰", max_width=PREVIEW_COMPOSITE_WIDTH)
+                                            
+                                            # 세로형은 플랫폼 업로드용 분할 조각도 제공
+                                            if layout_type == "B":
+                                                show_strip_download(iter(panel_images), "세로 스크롤 업로드용 분할 이미지 다운로드",
+                                                                    "my_webtoon_strip")
+                                            
+                                            # 생성 기록 저장 (다시 받기/레이아웃 변경은 API 호출 없이 가능)
+                                            try:
+                                                save_history_job(story_text, enhanced_style, layout_type, bubble_style,
+                                                                 character_description, saved_panels_data, saved_prompts,
+                                                                 raw_panels, combined_img,
+                                                                 {name: round(stage["end"] - stage["start"], 2)
+                                                                  for name, stage in pipeline_trace.items()})
+                                                st.caption("생성 결과가 '생성 기록' 탭에 저장되었습니다.")
+                                            except Exception as history_error:
+                                                st.warning(f"생성 기록 저장 실패: {str(history_error)}")
                                         
                                         except Exception as e:
                                             st.error(f"이미지 합치기 오류: {str(e)}")
@@ -936,11 +2822,12 @@ with tab1:
                                                     label="전체 웹툰 다운로드 (기본 레이아웃)",
                                                     data=buf,
                                                     file_name=f"my_complete_webtoon.png",
-                                                    mime="image/png"
+                                                    mime="image/png",
+                                                    on_click="ignore"
                                                 )
                                                 
                                                 # 합친 이미지 표시
-                                                st.image(combined_img, caption="전체 웹툰 (기본 레이아웃)", use_container_width=True)
+                                                show_preview(st, combined_img, caption="전체 웹툰 (기본 레이아웃)", max_width=PREVIEW_COMPOSITE_WIDTH)
                                             except Exception as e2:
                                                 st.error(f"대체 레이아웃 생성 오류: {str(e2)}")
                                     else:
@@ -952,8 +2839,318 @@ with tab1:
                     else:
                         st.error("사진 분석에 실패했습니다.")
             
+            except JobCancelled:
+                show_cancelled_job_once("active_job")
             except Exception as e:
                 st.error(f"오류가 발생했습니다: {str(e)}")
+            except BaseException:
+                # 취소 버튼 등으로 실행이 중단되면 남은 API 호출도 취소
+                abort_job()
+                raise
+            finally:
+                finish_job()
+
+with tab_series:
+    st.subheader("시리즈 모드")
+    st.markdown("같은 주인공으로 여러 에피소드를 한 번에 생성합니다. 스타일, 레이아웃, 고급 설정은 '웹툰 생성' 탭의 선택을 그대로 사용합니다.")
+    
+    with st.form("series_form"):
+        episodes_text = st.text_area("에피소드 스토리",
+                                     placeholder="에피소드마다 스토리를 입력하고, 에피소드 사이는 '---' 한 줄로 구분하세요...",
+                                     height=250)
+        series_photos = st.file_uploader("등장인물 사진 업로드 (필수, 여러 장 가능)", type=["png", "jpg", "jpeg"],
+                                         accept_multiple_files=True, key="series_photo")
+        series_cast_names_text = st.text_input("등장인물 이름 (사진 순서대로, 쉼표로 구분)", placeholder="예: 철수, 영희",
+                                               key="series_cast_names")
+        series_concurrency = st.slider("동시 API 호출 수", min_value=1, max_value=8, value=4,
+                                       help="모든 에피소드의 패널이 하나의 작업 큐를 공유합니다. 높을수록 빨라지지만 API 요청 제한에 걸릴 수 있습니다.")
+        series_submit = st.form_submit_button("시리즈 생성하기")
+    
+    if not series_submit:
+        show_cancelled_job_once("active_series_job")
+    if series_submit:
+        episodes = split_episodes(episodes_text)
+        if not api_key and not offline_mode:
+            st.error("OpenAI API 키를 입력해주세요! (키 없이 실행하려면 로컬 절차적 백엔드와 '이전 분석 결과 재사용'을 함께 선택하세요)")
+        elif not episodes:
+            st.error("에피소드 스토리를 입력해주세요!")
+        elif not series_photos:
+            st.error("등장인물 사진을 한 장 이상 업로드해주세요!")
+        else:
+            try:
+                series_start = time.time()
+                layout_type = st.session_state.selected_layout
+                style_description = get_style_description(final_style, style_guide)
+                enhanced_style = final_style + style_description
+                image_backend = create_image_backend(image_backend_name, image_style)
+                total_panels = len(episodes) * num_panels
+                
+                # 에피소드를 SERIES_BATCH_EPISODES개씩 묶어 스토리 분석과 프롬프트 생성을 묶음마다 한 번씩 요청
+                episode_batches = [list(range(start, min(start + SERIES_BATCH_EPISODES, len(episodes))))
+                                   for start in range(0, len(episodes), SERIES_BATCH_EPISODES)]
+                
+                # 취소 버튼 (인물별 사진 분석 + 묶음별 스토리/프롬프트 2회 + 패널 이미지 호출)
+                start_job_with_cancel("active_series_job", len(series_photos) + 2 * len(episode_batches)
+                                      + (total_panels if image_backend.calls_api else 0))
+                
+                cast_names = parse_cast_names(series_cast_names_text, len(series_photos))
+                story_cast_names = cast_names if len(series_photos) > 1 or series_cast_names_text.strip() else None
+                
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                
+                episode_panels = [[None] * num_panels for _ in episodes]
+                episode_raw_panels = [[None] * num_panels for _ in episodes]
+                episode_panels_data = [[] for _ in episodes]
+                episode_prompts = [[] for _ in episodes]
+                episode_dialogues = [[""] * num_panels for _ in episodes]
+                episode_failed = [False] * len(episodes)
+                finished_panels = 0
+                # 색감 통일은 에피소드마다 1번 패널을 기준으로 함 (완성 순서와 관계없이 같은 결과)
+                color_states = [new_color_state() for _ in episodes]
+                
+                with create_api_pool(series_concurrency) as pool:
+                    # 인물별 사진 분석(인물당 1회)과 묶음별 장면 분석은 서로 독립적이므로 함께 제출
+                    status_text.text(f"등장인물 사진 {len(series_photos)}장과 {len(episodes)}개 에피소드 스토리를 분석하는 중...")
+                    photo_futures = [pool.submit(analyze_photo, normalize_photo(photo)) for photo in series_photos]
+                    story_futures = {
+                        pool.submit(analyze_series, [episodes[e] for e in batch], num_panels, layout_type, story_cast_names): batch
+                        for batch in episode_batches
+                    }
+                    photo_descriptions = [wait_for_result(future) for future in photo_futures]
+                    character_descriptor = CharacterDescriptor(cast_names, photo_descriptions) if all(photo_descriptions) else None
+                    character_description = character_descriptor.source if character_descriptor else None
+                    
+                    if character_description:
+                        with st.expander("사진 분석 결과"):
+                            st.write(character_description)
+                        
+                        # 장면 분석이 끝난 묶음부터 프롬프트 생성 제출 (분석에 성공한 에피소드만 묶어서)
+                        prompt_futures = {}
+                        for future in iter_completed(story_futures):
+                            analyzed = []
+                            for e, panel_descriptions in zip(story_futures[future], future.result()):
+                                if not panel_descriptions:
+                                    episode_failed[e] = True
+                                    finished_panels += num_panels
+                                    st.error(f"{e+1}화 스토리 분석에 실패했습니다.")
+                                    continue
+                                panel_descriptions_data = normalize_panel_descriptions(panel_descriptions, num_panels)
+                                episode_panels_data[e] = panel_descriptions_data
+                                for i, panel in enumerate(panel_descriptions_data):
+                                    episode_dialogues[e][i] = panel.get("dialogue", "")
+                                analyzed.append(e)
+                            if analyzed:
+                                prompt_future = pool.submit(create_series_prompts, [episode_panels_data[e] for e in analyzed],
+                                                            enhanced_style, character_descriptor, num_panels, layout_type,
+                                                            story_cast_names)
+                                prompt_futures[prompt_future] = analyzed
+                        
+                        # 프롬프트가 준비된 에피소드부터 패널 생성을 같은 큐에 넣기
+                        panel_futures = {}
+                        for future in iter_completed(prompt_futures):
+                            for e, prompts in zip(prompt_futures[future], future.result()):
+                                if not prompts:
+                                    episode_failed[e] = True
+                                    finished_panels += num_panels
+                                    st.error(f"{e+1}화 프롬프트 생성에 실패했습니다.")
+                                    continue
+                                episode_prompts[e] = prompts
+                                # 백엔드가 한 번에 처리할 수 있는 만큼 묶어서 큐에 넣기 (DALL-E 3는 패널 단위)
+                                batch_size = max(1, image_backend.max_batch)
+                                for batch_start in range(0, len(prompts), batch_size):
+                                    indices = list(range(batch_start, min(batch_start + batch_size, len(prompts))))
+                                    panel_future = pool.submit(generate_panel_images,
+                                                               [prompts[i] for i in indices],
+                                                               enhanced_style, final_style, character_descriptor,
+                                                               image_backend, style_description, quality=image_quality,
+                                                               panel_labels=[f"{e+1}화 {i+1}번 패널" for i in indices])
+                                    panel_futures[panel_future] = (e, indices)
+                        
+                        for future in iter_completed(panel_futures):
+                            e, indices = panel_futures[future]
+                            results = list(zip(indices, future.result()))
+                            if harmonize_colors:
+                                results = [ready for i, img in results
+                                           for ready in harmonize_in_order(color_states[e], i, img, harmonize_method,
+                                                                           harmonize_strength)]
+                            for i, img in results:
+                                if img:
+                                    episode_raw_panels[e][i] = img
+                                    episode_panels[e][i] = add_speech_bubble(img, episode_dialogues[e][i], bubble_style, bubble_placement)
+                                    job_token.finished_panels.append((f"{e+1}화 {i+1}번 패널", episode_panels[e][i]))
+                                else:
+                                    st.error(f"{e+1}화 {i+1}번 패널 생성에 실패했습니다.")
+                                finished_panels += 1
+                            status_text.text(f"패널 생성 중... ({finished_panels}/{total_panels})")
+                            progress_bar.progress(finished_panels / total_panels)
+                    else:
+                        # 사진 분석이 실패하면 남은 스토리 분석은 취소
+                        for future in story_futures:
+                            future.cancel()
+                
+                if character_description:
+                    progress_bar.progress(1.0)
+                    status_text.text("시리즈 생성 완료!")
+                    st.success(f"{len(episodes)}개 에피소드 생성 완료 (총 {time.time() - series_start:.1f}초)")
+                    if chat_cache_stats["hits"]:
+                        st.caption(f"분석 결과 재사용: {chat_cache_stats['hits']}회 (새 분석 호출 {chat_cache_stats['misses']}회)")
+                    show_prompt_token_report(character_descriptor)
+                    harmonized_count = sum(state["count"] for state in color_states)
+                    if harmonize_colors and harmonized_count:
+                        st.caption(f"패널 색감 통일: {harmonized_count}개 패널, "
+                                   f"{sum(state['elapsed'] for state in color_states) * 1000:.1f} ms")
+                    
+                    # 에피소드별 결과 표시 및 다운로드
+                    series_zip = BytesIO()
+                    with zipfile.ZipFile(series_zip, "w") as zf:
+                        for e, panels in enumerate(episode_panels):
+                            if episode_failed[e]:
+                                continue
+                            finished = [img for img in panels if img is not None]
+                            if not finished:
+                                continue
+                            st.markdown(f"### {e+1}화")
+                            combined_img = create_layout_image(finished, layout_type)
+                            buf = BytesIO()
+                            combined_img.save(buf, format="PNG")
+                            zf.writestr(f"episode_{e+1:02d}_layout_{layout_type}.png", buf.getvalue())
+                            show_preview(st, combined_img, caption=f"{e+1}화", max_width=PREVIEW_COMPOSITE_WIDTH)
+                            
+                            # 에피소드별 생성 기록 저장
+                            finished_indices = [i for i, img in enumerate(episode_raw_panels[e]) if img is not None]
+                            try:
+                                save_history_job(episodes[e], enhanced_style, layout_type, bubble_style, character_description,
+                                                 [episode_panels_data[e][i] for i in finished_indices],
+                                                 [episode_prompts[e][i] for i in finished_indices],
+                                                 [episode_raw_panels[e][i] for i in finished_indices],
+                                                 combined_img, {"series_total": round(time.time() - series_start, 2)})
+                            except Exception as history_error:
+                                st.warning(f"{e+1}화 생성 기록 저장 실패: {str(history_error)}")
+                    series_zip.seek(0)
+                    
+                    st.download_button(
+                        label="시리즈 전체 다운로드 (ZIP)",
+                        data=series_zip,
+                        file_name="my_webtoon_series.zip",
+                        mime="application/zip",
+                        on_click="ignore"
+                    )
+                    
+                    # 시리즈 전체를 한 편의 세로 스크롤로 이어 붙인 업로드용 조각 (패널을 하나씩 읽어 조각 단위로 합성)
+                    show_strip_download((img for e, panels in enumerate(episode_panels) if not episode_failed[e]
+                                         for img in panels if img is not None),
+                                        "시리즈 전체 세로 스크롤 분할 이미지 다운로드", "my_webtoon_series_strip")
+                else:
+                    st.error("사진 분석에 실패했습니다.")
+            
+            except JobCancelled:
+                show_cancelled_job_once("active_series_job")
+            except Exception as e:
+                st.error(f"오류가 발생했습니다: {str(e)}")
+            except BaseException:
+                # 취소 버튼 등으로 실행이 중단되면 남은 API 호출도 취소
+                abort_job()
+                raise
+            finally:
+                finish_job()
+
+# 선택된 기록 삭제 (버튼 콜백에서 지워 두면 다시 그릴 때 바로 반영됨)
+def delete_selected_history_job(job_id):
+    delete_history_job(job_id)
+    st.session_state.history_selected = None
+
+# 생성 기록 보기 (페이지 이동, 열기, 재배치는 이 부분만 다시 실행)
+@timed_fragment("생성 기록")
+def history_view():
+    try:
+        total_jobs = count_history_jobs()
+    except Exception as e:
+        total_jobs = 0
+        st.error(f"생성 기록을 불러오지 못했습니다: {str(e)}")
+    
+    if total_jobs == 0:
+        st.info("아직 저장된 생성 기록이 없습니다.")
+    else:
+        total_pages = (total_jobs + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        history_page = st.number_input(f"페이지 (전체 {total_pages}페이지, {total_jobs}개)", min_value=1,
+                                       max_value=total_pages, value=1, step=1, key="history_page")
+        
+        # 현재 페이지의 썸네일만 읽기
+        history_jobs = list_history_jobs((history_page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+        history_cols = st.columns(4)
+        for index, job in enumerate(history_jobs):
+            with history_cols[index % 4]:
+                thumbnail = get_history_thumbnail(job["id"])
+                if thumbnail:
+                    st.image(thumbnail, use_container_width=True)
+                st.caption(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(job['created_at']))} · 레이아웃 {job['layout']}")
+                st.markdown((job["story"] or "")[:40] + ("..." if len(job["story"] or "") > 40 else ""))
+                if st.button("열기", key=f"history_open_{job['id']}"):
+                    st.session_state.history_selected = job["id"]
+        
+        # 선택된 기록 상세 (원본 이미지는 이때만 읽음)
+        selected_job_id = st.session_state.get("history_selected")
+        selected_job = get_history_job(selected_job_id) if selected_job_id else None
+        if selected_job:
+            st.divider()
+            st.markdown(f"### 선택된 기록: {time.strftime('%Y-%m-%d %H:%M', time.localtime(selected_job['created_at']))}")
+            st.markdown(f"**스타일**: {selected_job['style']}")
+            with st.expander("스토리 및 대사"):
+                st.write(selected_job["story"])
+                for i, dialogue in enumerate(json.loads(selected_job["dialogues"])):
+                    st.markdown(f"**{i+1}번 패널**: {dialogue}")
+            
+            composite_data = read_history_artifact(selected_job_id, "composite.png")
+            if composite_data:
+                st.download_button(
+                    label="저장된 웹툰 다시 다운로드",
+                    data=composite_data,
+                    file_name=f"my_webtoon_layout_{selected_job['layout']}.png",
+                    mime="image/png",
+                    on_click="ignore",
+                    key="history_download"
+                )
+            else:
+                st.warning("저장된 이미지를 불러오지 못했습니다.")
+            
+            # 다른 레이아웃/말풍선으로 재배치 (API 호출 없음)
+            relayout_col1, relayout_col2 = st.columns(2)
+            with relayout_col1:
+                relayout_type = st.selectbox("레이아웃 변경", ["A", "B", "C", "D"],
+                                             index=["A", "B", "C", "D"].index(selected_job["layout"]),
+                                             format_func=lambda key: LAYOUT_LABELS[key], key="history_layout")
+            with relayout_col2:
+                relayout_bubble = st.selectbox("말풍선 스타일 변경", ["기본 방울형", "구름형", "직사각형", "타원형"],
+                                               key="history_bubble")
+            if st.button("다시 배치하기", key="history_relayout"):
+                dialogues = json.loads(selected_job["dialogues"])
+                raw_panels = load_history_panels(selected_job_id, selected_job["panel_count"])
+                if raw_panels is None:
+                    st.error("저장된 패널 이미지를 불러오지 못했습니다.")
+                else:
+                    bubbled = [add_speech_bubble(panel, dialogues[i] if i < len(dialogues) else "", relayout_bubble,
+                                                 bubble_placement)
+                               for i, panel in enumerate(raw_panels)]
+                    relayout_img = create_layout_image(bubbled, relayout_type)
+                    show_preview(st, relayout_img, caption=f"{LAYOUT_LABELS[relayout_type]} 재배치", max_width=PREVIEW_COMPOSITE_WIDTH)
+                    buf = BytesIO()
+                    relayout_img.save(buf, format="PNG")
+                    st.download_button(
+                        label=f"{LAYOUT_LABELS[relayout_type]} 웹툰 다운로드",
+                        data=buf.getvalue(),
+                        file_name=f"my_webtoon_layout_{relayout_type}.png",
+                        mime="image/png",
+                        on_click="ignore",
+                        key="history_relayout_download"
+                    )
+            
+            st.button("이 기록 삭제", key="history_delete", on_click=delete_selected_history_job, args=(selected_job_id,))
+
+with tab_history:
+    st.subheader("생성 기록")
+    st.markdown("이전에 생성한 웹툰을 API 호출 없이 다시 다운로드하거나 다른 레이아웃으로 재배치할 수 있습니다.")
+    history_view()
 
 with tab2:
     # 스타일 참조 이미지 및 설명
@@ -998,7 +3195,7 @@ with tab2:
     2. 스타일 카테고리와 세부 스타일을 선택합니다.
     3. 원하는 4컷 레이아웃을 선택합니다. (A, B, C, D 중 하나)
     4. 웹툰으로 만들고 싶은 스토리를 입력합니다.
-    5. 당신의 사진을 업로드합니다. (필수)
+    5. 당신의 사진을 업로드합니다. (필수, 커플/친구 웹툰은 인물마다 한 장씩 올리고 이름을 쉼표로 구분해 입력)
     6. 말풍선 스타일을 선택할 수 있습니다.
     7. '웹툰 생성하기' 버튼을 클릭합니다.
     8. 생성된 각 패널의 대화를 수정할 수 있습니다.
@@ -1021,7 +3218,81 @@ with tab2:
     - DALL-E 3 API는 생성당 비용이 발생합니다.
     - 이미지 생성에는 시간이 소요될 수 있습니다 (전체 과정에 약 1-2분).
     - 더 좋은 결과를 위해 구체적인 스토리를 제공하세요.
-    - 업로드된 사진은 주인공 캐릭터의 특징을 결정하는 데 사용됩니다.
+    - 업로드된 사진은 주인공 캐릭터의 특징을 결정하는 데 사용됩니다. 여러 장을 올리면 인물별로 동시에 분석해 등장인물표로 합칩니다.
     - 실패한 이미지 생성은 단순화된 프롬프트로 재시도합니다.
     - 품질을 'standard'로 설정하면 API 비용을 절약할 수 있습니다.
+    - '시리즈 모드' 탭에서는 같은 주인공으로 여러 에피소드를 한 번에 생성할 수 있습니다. 에피소드 사이는 '---' 한 줄로 구분합니다.
+    - 생성된 웹툰은 '생성 기록' 탭에 저장되어, API 호출 없이 다시 다운로드하거나 다른 레이아웃으로 재배치할 수 있습니다.
+    - 사이드바의 '이전 분석 결과 재사용'을 켜면 같은 입력으로 다시 생성할 때 사진/스토리 분석과 프롬프트 생성을 건너뛰고 이전과 같은 프롬프트로 이미지를 생성합니다.
+    - 생성 중 '⏹ 생성 취소'를 누르면 남은 API 호출을 보내지 않고 중단하며, 이미 완성된 패널은 다운로드할 수 있습니다.
     """)
+
+# 이번 실행에서 브라우저로 보낸 이미지 전송량 표시
+if measure_payload:
+    payload_history = st.session_state.setdefault("payload_history", [])
+    # 실행 번호는 따로 세어 두어야 최근 20회만 남긴 뒤에도 계속 늘어남
+    st.session_state.payload_run = st.session_state.get("payload_run", 0) + 1
+    payload_history.append({
+        "실행": st.session_state.payload_run,
+        "이미지 수": payload_meter["images"],
+        "기존 방식 (KB)": round(payload_meter["before"] / 1024, 1),
+        "미리보기 (KB)": round(payload_meter["after"] / 1024, 1),
+    })
+    del payload_history[:-20]
+    with payload_report.container():
+        st.caption("실행별 이미지 전송량 (최근 20회)")
+        st.dataframe(payload_history, hide_index=True)
+
+# 프로파일링 결과 (관리자용)
+profile_result = profiling_slot.finish(script_profiler) if script_profiler is not None else None
+if profiling_enabled and profile_result is None:
+    st.caption("🛠 다른 세션에서 프로파일링 중이라 이번 실행은 측정하지 않았습니다.")
+if profile_result is not None:
+    memory_snapshot, memory_current, memory_peak = profile_result
+    script_run_ms = (time.perf_counter() - script_run_start) * 1000
+    record_interaction("전체 실행", script_run_ms / 1000)
+    
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_path = os.path.join(PROFILE_DIR, f"run_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.prof")
+    script_profiler.dump_stats(profile_path)
+    prune_profiles()
+    
+    profile_stats = pstats.Stats(script_profiler)
+    profile_rows = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in profile_stats.stats.items():
+        profile_rows.append({
+            "함수": f"{function} ({os.path.basename(filename)}:{line})",
+            "호출 수": ncalls,
+            "자체 시간 (ms)": round(tottime * 1000, 2),
+            "누적 시간 (ms)": round(cumtime * 1000, 2),
+        })
+    profile_rows.sort(key=lambda row: row["누적 시간 (ms)"], reverse=True)
+    
+    allocation_rows = []
+    for stat in memory_snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        allocation_rows.append({
+            "위치": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+            "크기 (KB)": round(stat.size / 1024, 1),
+            "할당 수": stat.count,
+        })
+    
+    # 조작 단위별 서버 시간 (전체 실행 vs 부분 재실행)
+    interaction_rows = {}
+    for timing in st.session_state.get("interaction_timings", []):
+        interaction_rows.setdefault(timing["범위"], []).append(timing["서버 시간 (ms)"])
+    interaction_rows = [{"범위": scope, "횟수": len(times), "중앙값 (ms)": sorted(times)[len(times) // 2],
+                         "최대 (ms)": max(times)} for scope, times in interaction_rows.items()]
+    
+    with st.expander("🛠 프로파일링 (관리자)", expanded=False):
+        st.caption(f"스크립트 실행 {script_run_ms:.0f} ms · 메모리 현재 {memory_current / 1024 / 1024:.1f} MB / "
+                   f"최대 {memory_peak / 1024 / 1024:.1f} MB · 저장 위치: {profile_path}")
+        st.markdown(f"**조작별 서버 시간** (최근 {INTERACTION_HISTORY_SIZE}회)")
+        st.dataframe(interaction_rows, hide_index=True)
+        st.markdown("**누적 시간 상위 함수**")
+        st.dataframe(profile_rows[:PROFILE_TOP_FUNCTIONS], hide_index=True)
+        st.markdown("**메모리 할당 상위 위치**")
+        st.dataframe(allocation_rows, hide_index=True)
+        with open(profile_path, "rb") as f:
+            st.download_button(".prof 파일 다운로드", data=f.read(), file_name=os.path.basename(profile_path),
+                               mime="application/octet-stream", on_click="ignore", key="profile_download")